@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_alter_user_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='passwordresetotp',
+            index=models.Index(fields=['user', 'otp_code', 'created_at'], name='otp_user_code_created_idx'),
+        ),
+    ]
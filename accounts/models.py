@@ -91,6 +91,14 @@ class PasswordResetOTP(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # OTP checks: a user's code, latest first; `used` is a low-cardinality
+            # flag, checked on the row the index finds
+            models.Index(
+                fields=["user", "otp_code", "created_at"],
+                name="otp_user_code_created_idx",
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         """Set expiration time to 10 minutes from creation if not already set"""
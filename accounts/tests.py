@@ -1,3 +1,17 @@
 from django.test import TestCase
 
-# Create your tests here.
+from food.tests import QueryPlanTestMixin
+
+from .models import PasswordResetOTP, User
+
+
+class PasswordResetOTPQueryPlanTests(QueryPlanTestMixin, TestCase):
+    def test_otp_check_uses_user_code_created_index(self):
+        user = User.objects.create(username="otp", email="otp@x.co")
+        PasswordResetOTP.objects.create(user=user, otp_code="123456")
+
+        otps = PasswordResetOTP.objects.filter(
+            user=user, otp_code="123456", used=False
+        ).order_by("-created_at")[:1]
+
+        self.assertUsesIndex(otps, "otp_user_code_created_idx")
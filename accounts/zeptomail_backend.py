@@ -3,13 +3,14 @@ ZeptoMail email backend for Django using REST API
 """
 
 import json
-import requests
 from django.core.mail.backends.base import BaseEmailBackend
 from django.core.mail import EmailMessage
 from django.conf import settings
 from decouple import config
 import logging
 
+from ayta.http_client import gateway
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,7 +21,8 @@ class ZeptoMailBackend(BaseEmailBackend):
 
     def __init__(self, fail_silently=False, **kwargs):
         super().__init__(fail_silently=fail_silently, **kwargs)
-        self.api_url = "https://api.zeptomail.com/v1.1/email"
+        # sent through the pooled "zeptomail" gateway client
+        self.api_path = "/email"
         self.api_key = config("ZEPTOMAIL_API_KEY", default="")
         self.from_email = config("ZEPTOMAIL_FROM_EMAIL", default="noreply@ayta.com.ng")
         self.from_name = config("ZEPTOMAIL_FROM_NAME", default="AyTa")
@@ -94,8 +96,8 @@ class ZeptoMailBackend(BaseEmailBackend):
                 email_data["textbody"] = text_content
 
             # Send the email
-            response = requests.post(
-                self.api_url, headers=headers, data=json.dumps(email_data), timeout=30
+            response = gateway("zeptomail").post(
+                self.api_path, headers=headers, data=json.dumps(email_data)
             )
 
             if response.status_code in [
@@ -3,14 +3,16 @@ ZeptoMail utility functions for sending emails via REST API
 """
 
 import json
-import requests
 from decouple import config
 import logging
 
+from ayta.http_client import gateway
+
 logger = logging.getLogger(__name__)
 
 # ZeptoMail configuration
-ZEPTOMAIL_API_URL = "https://api.zeptomail.com/v1.1/email"
+# Path on the "zeptomail" gateway (settings.OUTBOUND_GATEWAYS)
+ZEPTOMAIL_SEND_PATH = "/email"
 ZEPTOMAIL_API_KEY = config("ZEPTOMAIL_API_KEY", default="")
 ZEPTOMAIL_FROM_EMAIL = config("ZEPTOMAIL_FROM_EMAIL", default="noreply@ayta.com.ng")
 ZEPTOMAIL_FROM_NAME = config("ZEPTOMAIL_FROM_NAME", default="AyTa")
@@ -56,8 +58,8 @@ def send_email_via_zeptomail(
             email_data["textbody"] = text_content
 
         # Send the email
-        response = requests.post(
-            ZEPTOMAIL_API_URL, headers=headers, data=json.dumps(email_data), timeout=30
+        response = gateway("zeptomail").post(
+            ZEPTOMAIL_SEND_PATH, headers=headers, data=json.dumps(email_data)
         )
 
         if response.status_code in [
@@ -132,8 +134,8 @@ def send_bulk_email_via_zeptomail(subject, html_content, recipients, text_conten
             email_data["textbody"] = text_content
 
         # Send the email
-        response = requests.post(
-            ZEPTOMAIL_API_URL, headers=headers, data=json.dumps(email_data), timeout=30
+        response = gateway("zeptomail").post(
+            ZEPTOMAIL_SEND_PATH, headers=headers, data=json.dumps(email_data)
         )
 
         if response.status_code in [
@@ -0,0 +1,300 @@
+"""
+Shared outbound HTTP client for the payment and email gateways.
+
+Each gateway named in settings.OUTBOUND_GATEWAYS gets one long-lived
+requests.Session per process, so calls reuse pooled keep-alive connections
+instead of paying a TCP+TLS handshake every time. A session mounts an
+HTTPAdapter with its own pool size and urllib3 retry policy: failed connects are
+retried for every method (nothing reached the gateway yet), while read errors and
+502/503/504 answers are only retried for idempotent methods, so a POST that may
+have gone through is never sent twice.
+
+Every call is timed; `gateway_stats()` returns per-gateway counts, error counts,
+latency percentiles and circuit state for this process.
+
+Each gateway also has a circuit breaker. Over the last `breaker_window` calls,
+once at least `breaker_min_calls` were made and the share of failed calls
+(exceptions and 5xx) reaches `breaker_failure_rate`, or the share slower than
+`slow_call_ms` reaches `breaker_slow_rate`, the circuit opens: calls raise
+CircuitOpenError immediately for `breaker_open_seconds` instead of tying up a
+worker until the timeout. After that one probe call is let through (half-open);
+its outcome closes the circuit or opens it again. Breakers are per process, like
+the sessions.
+
+    resp = gateway("paystack").post("/transaction/initialize", json=payload)
+"""
+
+import logging
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Recent call latencies kept per gateway for the percentiles in gateway_stats()
+LATENCY_WINDOW = 500
+
+DEFAULT_GATEWAY = {
+    "base_url": "",
+    "connect_timeout": 5,
+    "read_timeout": 15,
+    "retries": 2,
+    "backoff": 0.3,
+    "pool_size": 10,
+    "slow_call_ms": 5000,
+    "breaker_window": 20,
+    "breaker_min_calls": 10,
+    "breaker_failure_rate": 0.5,
+    "breaker_slow_rate": 0.5,
+    "breaker_open_seconds": 30,
+}
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+_clients: Dict[str, "GatewayClient"] = {}
+_clients_lock = Lock()
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a gateway whose circuit is open."""
+
+    def __init__(self, gateway_name: str, retry_after: float):
+        self.gateway_name = gateway_name
+        self.retry_after = retry_after
+        super().__init__(f"{gateway_name} is unavailable; retry in {retry_after:.0f}s")
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker fed with each call's outcome."""
+
+    def __init__(self, name: str, options: Dict[str, Any]):
+        self.name = name
+        self.slow_call_ms = options["slow_call_ms"]
+        self.min_calls = options["breaker_min_calls"]
+        self.failure_rate = options["breaker_failure_rate"]
+        self.slow_rate = options["breaker_slow_rate"]
+        self.open_seconds = options["breaker_open_seconds"]
+        self._lock = Lock()
+        # (failed, slow) for the most recent calls while closed
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(
+            maxlen=options["breaker_window"]
+        )
+        self._state = CIRCUIT_CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == CIRCUIT_OPEN and not self._retry_after():
+                return CIRCUIT_HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through (0 otherwise)."""
+        with self._lock:
+            return self._retry_after() if self._state == CIRCUIT_OPEN else 0.0
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless this call may go to the gateway."""
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return
+            if self._state == CIRCUIT_OPEN:
+                retry_after = self._retry_after()
+                if retry_after:
+                    raise CircuitOpenError(self.name, retry_after)
+                self._state = CIRCUIT_HALF_OPEN
+            if self._probing:
+                # half-open lets a single probe through at a time
+                raise CircuitOpenError(self.name, 1.0)
+            self._probing = True
+
+    def record(self, elapsed_ms: float, failed: bool) -> None:
+        slow = elapsed_ms >= self.slow_call_ms
+        with self._lock:
+            if self._state == CIRCUIT_HALF_OPEN:
+                self._probing = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self._state = CIRCUIT_CLOSED
+                    self._outcomes.clear()
+                    logger.warning("%s circuit closed", self.name)
+                return
+            if self._state == CIRCUIT_OPEN:
+                # a call that started before the circuit opened
+                return
+
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(f for f, _ in self._outcomes)
+            slow_calls = sum(s for _, s in self._outcomes)
+            if (
+                failures / calls >= self.failure_rate
+                or slow_calls / calls >= self.slow_rate
+            ):
+                self._open()
+
+    def _open(self) -> None:
+        self._state = CIRCUIT_OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        logger.warning("%s circuit opened for %ss", self.name, self.open_seconds)
+
+
+class LatencyStats:
+    """Thread-safe call counters and a rolling window of latencies (ms)."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._lock = Lock()
+        self._recent: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float, failed: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self._recent.append(elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self._recent)
+            calls, errors = self.calls, self.errors
+            total_ms, max_ms = self.total_ms, self.max_ms
+
+        def percentile(p):
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(len(recent) * p))], 1)
+
+        return {
+            "calls": calls,
+            "errors": errors,
+            "avg_ms": round(total_ms / calls, 1) if calls else None,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(max_ms, 1),
+        }
+
+
+class GatewayClient:
+    """A pooled session plus timeouts, latency stats and a breaker for one gateway."""
+
+    def __init__(self, name: str, options: Dict[str, Any]):
+        self.name = name
+        self.base_url = options["base_url"].rstrip("/")
+        self.timeout = (options["connect_timeout"], options["read_timeout"])
+        self.stats = LatencyStats()
+        self.breaker = CircuitBreaker(name, options)
+
+        retry = Retry(
+            total=options["retries"],
+            connect=options["retries"],
+            read=options["retries"],
+            status=options["retries"],
+            backoff_factor=options["backoff"],
+            status_forcelist=(502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            # hand the last 5xx back to the caller rather than raising RetryError
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=options["pool_size"],
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path: str) -> str:
+        if path.startswith(("http://", "https://")):
+            return path
+        return self.base_url + path
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Send a request through the pooled session. `path` is joined to the
+        gateway's base URL unless it is already absolute; the gateway's
+        timeouts apply unless `timeout` is passed. Raises CircuitOpenError
+        without sending anything while the gateway's circuit is open.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        self.breaker.before_call()
+        started = time.monotonic()
+        failed = True
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            elapsed_ms = (time.monotonic() - started) * 1000
+            self.stats.record(elapsed_ms, failed)
+            self.breaker.record(elapsed_ms, failed)
+            logger.debug("%s %s %s took %.1f ms", self.name, method, path, elapsed_ms)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+
+def gateway_options(name: str) -> Dict[str, Any]:
+    configured = getattr(settings, "OUTBOUND_GATEWAYS", {})
+    if name not in configured:
+        raise KeyError(f"Unknown outbound gateway {name!r}")
+    return {**DEFAULT_GATEWAY, **configured[name]}
+
+
+def gateway(name: str) -> GatewayClient:
+    """The process-wide client for gateway `name` (created on first use)."""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = GatewayClient(name, gateway_options(name))
+                _clients[name] = client
+    return client
+
+
+def gateway_stats(name: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Latency stats and circuit state for the gateways this process has called."""
+    names = [name] if name else sorted(_clients)
+    return {
+        n: {
+            **_clients[n].stats.snapshot(),
+            "circuit": _clients[n].breaker.state,
+            "retry_after": round(_clients[n].breaker.retry_after(), 1),
+        }
+        for n in names
+        if n in _clients
+    }
+
+
+def reset_gateways() -> None:
+    """Close and forget every client (used by tests and after settings changes)."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.session.close()
+        _clients.clear()
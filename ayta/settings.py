@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
+from corsheaders.defaults import default_headers
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
@@ -194,8 +195,83 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# locmem is per-process; point CACHE_BACKEND at a shared backend (file, redis,
+# memcached) when running several workers so catalog invalidation reaches all of them.
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default="ayta-default"),
+    }
+}
+
+# Seconds a serialized catalog payload is kept (entries are also invalidated on menu changes)
+CATALOG_CACHE_TIMEOUT = config("CATALOG_CACHE_TIMEOUT", default=60 * 60 * 24, cast=int)
+
+
+# Where guest carts live: "db" (Cart rows keyed by session) or "cache" (the
+# default cache above; rows are only written at checkout or when merged on login).
+# Use a shared, persistent cache backend before switching to "cache".
+GUEST_CART_STORE = config("GUEST_CART_STORE", default="db")
+# Seconds an untouched cache-backed guest cart is kept
+GUEST_CART_TIMEOUT = config("GUEST_CART_TIMEOUT", default=60 * 60 * 24 * 14, cast=int)
+
+
 # Paystack Configuration
 PAYSTACK_SECRET_KEY = config("PAYSTACK_SECRET_KEY", default="")
+PAYSTACK_BASE_URL = config("PAYSTACK_BASE_URL", default="https://api.paystack.co")
+# "sync": checkout waits for Paystack; "deferred": checkout answers 202 and a
+# background pool fetches the authorization URL (poll payments/status/<reference>/)
+PAYSTACK_INIT_MODE = config("PAYSTACK_INIT_MODE", default="sync")
+PAYSTACK_INIT_WORKERS = config("PAYSTACK_INIT_WORKERS", default=4, cast=int)
+# Seconds after which an initialization that hasn't produced a URL or an error
+# (e.g. a deferred job lost to a restart) is reported as failed and can be retried
+PAYSTACK_INIT_TIMEOUT = config("PAYSTACK_INIT_TIMEOUT", default=120, cast=int)
+
+
+# Checkout responses are replayed for retries with the same Idempotency-Key for
+# this many seconds; a key whose first request is still running is locked for at
+# most IDEMPOTENCY_LOCK_TIMEOUT (keep it above the slowest checkout). Needs a
+# cache shared by all workers, like GUEST_CART_STORE = "cache".
+IDEMPOTENCY_KEY_TIMEOUT = config(
+    "IDEMPOTENCY_KEY_TIMEOUT", default=60 * 60 * 24, cast=int
+)
+IDEMPOTENCY_LOCK_TIMEOUT = config("IDEMPOTENCY_LOCK_TIMEOUT", default=90, cast=int)
+
+# Outbound gateways called through ayta.http_client: one pooled keep-alive session
+# per gateway. Timeouts are seconds; connect failures (and read errors / 5xx on
+# GET) are retried `retries` times with exponential `backoff`. The circuit opens
+# for `breaker_open_seconds` once half of the recent calls fail or take longer
+# than `slow_call_ms` (see ayta/http_client.py for the other breaker_* options).
+OUTBOUND_GATEWAYS = {
+    "paystack": {
+        "base_url": PAYSTACK_BASE_URL,
+        "connect_timeout": config("PAYSTACK_CONNECT_TIMEOUT", default=5, cast=float),
+        "read_timeout": config("PAYSTACK_READ_TIMEOUT", default=15, cast=float),
+        "retries": config("PAYSTACK_RETRIES", default=2, cast=int),
+        "backoff": 0.3,
+        "pool_size": config("PAYSTACK_POOL_SIZE", default=10, cast=int),
+        "slow_call_ms": config("PAYSTACK_SLOW_CALL_MS", default=5000, cast=int),
+        "breaker_open_seconds": config(
+            "PAYSTACK_BREAKER_OPEN_SECONDS", default=30, cast=int
+        ),
+    },
+    "zeptomail": {
+        "base_url": "https://api.zeptomail.com/v1.1",
+        "connect_timeout": config("ZEPTOMAIL_CONNECT_TIMEOUT", default=5, cast=float),
+        "read_timeout": config("ZEPTOMAIL_READ_TIMEOUT", default=30, cast=float),
+        "retries": config("ZEPTOMAIL_RETRIES", default=2, cast=int),
+        "backoff": 0.5,
+        "pool_size": config("ZEPTOMAIL_POOL_SIZE", default=5, cast=int),
+        "slow_call_ms": config("ZEPTOMAIL_SLOW_CALL_MS", default=10000, cast=int),
+        "breaker_open_seconds": config(
+            "ZEPTOMAIL_BREAKER_OPEN_SECONDS", default=60, cast=int
+        ),
+    },
+}
 
 
 # Static files (CSS, JavaScript, Images)
@@ -224,6 +300,18 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Custom request headers the frontend sends to cart endpoints
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    "x-cart-response",
+    "if-match",
+    "idempotency-key",
+)
+
+# Cart responses carry the cart version as an ETag (sent back in If-Match);
+# replayed checkout responses are flagged with Idempotent-Replayed
+CORS_EXPOSE_HEADERS = ["ETag", "Idempotent-Replayed", "Retry-After"]
+
 # Email Configuration - ZeptoMail Transactional Email Service
 EMAIL_BACKEND = "accounts.zeptomail_backend.ZeptoMailBackend"
 
@@ -2,6 +2,7 @@
 import json
 from typing import Any
 from django.contrib import admin
+from django.db.models import Prefetch
 from django.utils.html import format_html
 from .models import (
     CartPlan,
@@ -13,7 +14,9 @@ from .models import (
     Order,
     OrderItem,
     PaymentTransaction,
+    PaystackEvent,
 )
+from .pricing import price_cart
 
 admin.site.site_header = "AyTa"
 admin.site.site_title = "AyTa"
@@ -38,9 +41,21 @@ class CartAdmin(admin.ModelAdmin):
     search_fields = ("user__username", "user__email")
     inlines = (CartItemInline,)
     readonly_fields = ("created_at", "updated_at")
+    list_select_related = ("user",)
+
+    def get_queryset(self, request):
+        # prefetch what price_cart needs so the changelist doesn't query per row
+        return (
+            super()
+            .get_queryset(request)
+            .prefetch_related(
+                Prefetch("plans", queryset=CartPlan.objects.select_related("meal_plan")),
+                Prefetch("items", queryset=CartItem.objects.select_related("food_item")),
+            )
+        )
 
     def total_price_display(self, obj: Cart) -> Any:
-        return obj.total_price
+        return price_cart(obj).total
 
     total_price_display.short_description = "Total Price"
 
@@ -271,3 +286,28 @@ class PaymentTransactionAdmin(admin.ModelAdmin):
         return "-"
 
     authorization_link.short_description = "Authorization URL"
+
+
+@admin.register(PaystackEvent)
+class PaystackEventAdmin(admin.ModelAdmin):
+    list_display = (
+        "event",
+        "reference",
+        "outcome",
+        "attempts",
+        "received_at",
+        "processed_at",
+    )
+    list_filter = ("event", "outcome")
+    search_fields = ("reference", "event_key")
+    readonly_fields = (
+        "event_key",
+        "event",
+        "reference",
+        "payload",
+        "received_at",
+        "processed_at",
+        "attempts",
+        "outcome",
+        "last_error",
+    )
@@ -0,0 +1,601 @@
+"""
+Set-based cart mutations.
+
+Each operation issues a fixed number of statements regardless of how many meals
+a plan or selection contains, so add-to-cart latency doesn't grow with cart size.
+Callers are expected to run these inside `transaction.atomic()`.
+
+Custom items (cart_plan IS NULL) are upserted as "read ids, one CASE UPDATE,
+one bulk INSERT" rather than INSERT ... ON DUPLICATE KEY UPDATE: the
+(cart, food_item, cart_plan) unique key treats NULL cart_plan values as
+distinct on MySQL, so a duplicate custom line would never hit the key. Code
+that may insert a custom line therefore locks the cart row first, which
+serializes those inserts per cart.
+
+Every operation also accumulates its effect on the cart's stored totals
+(food.pricing.TOTAL_FIELDS); `CartMutation.commit()` applies them together with
+the version bump as one `F()` UPDATE, so the totals can't drift from the lines
+under concurrent mutations.
+"""
+
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .models import Cart, CartItem, CartPlan, FoodItem, MealPlan
+from .pricing import (
+    TOTAL_FIELDS,
+    PlanLine,
+    add_totals,
+    empty_totals,
+    food_totals,
+    line_totals,
+    plan_copy_totals,
+    price_cart,
+    price_lines,
+    quantize_total,
+)
+
+
+def ensure_cart(**lookup: Any) -> Cart:
+    """
+    Fetch the cart for `user=` or `session_key=`, creating it if needed. An
+    existing cart costs one SELECT. A new one is inserted with INSERT IGNORE /
+    ON CONFLICT DO NOTHING and read back, so parallel first requests from the
+    same visitor converge on one row instead of raising IntegrityError.
+    """
+    cart = Cart.objects.filter(**lookup).first()
+    if cart is None:
+        Cart.objects.bulk_create([Cart(**lookup)], ignore_conflicts=True)
+        try:
+            cart = Cart.objects.get(**lookup)
+        except Cart.DoesNotExist:
+            # our insert was ignored over a row committed after this
+            # transaction's snapshot (MySQL REPEATABLE READ inside an outer
+            # atomic block), which plain reads can't see; a locking read
+            # reads the latest committed row
+            with transaction.atomic():
+                cart = Cart.objects.select_for_update().get(**lookup)
+    return cart
+
+
+class CartOperationError(Exception):
+    """A batch operation that can't be applied; the whole batch is rolled back."""
+
+    def __init__(self, message: str, status_code: int, index: int):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.index = index
+
+
+class CartItemConflict(Exception):
+    """A custom line kept changing under a decrement; the client should retry."""
+
+
+class CartVersionConflict(Exception):
+    """The cart changed since the version the client sent in If-Match."""
+
+    def __init__(self, current_version: Optional[int]):
+        super().__init__("Cart version conflict.")
+        self.current_version = current_version
+
+
+def _bulk_increment(model, deltas: Dict[int, int]) -> None:
+    """Add deltas[pk] to `quantity` for every pk in a single CASE UPDATE."""
+    if not deltas:
+        return
+    model.objects.filter(pk__in=deltas).update(
+        quantity=Case(
+            *[
+                When(pk=pk, then=F("quantity") + Value(delta))
+                for pk, delta in deltas.items()
+            ],
+            output_field=PositiveIntegerField(),
+        )
+    )
+
+
+class BaseCartMutation(ABC):
+    """
+    Applies changes to one cart and records which lines they touched, so a
+    mutation endpoint can answer with just those lines (see CartDeltaSerializer).
+    Call `commit()` once the changes are applied to bump the cart version.
+
+    With `expected_version` (from If-Match) the commit only succeeds if nobody
+    else committed to the cart in the meantime, otherwise it raises
+    CartVersionConflict; run it inside transaction.atomic() so the changes roll back.
+
+    Subclasses implement the operations for a cart store: CartMutation for
+    Cart rows, food.guest_carts.GuestCartMutation for cache-backed guest carts.
+    """
+
+    def __init__(self, cart: Cart, expected_version: Optional[int] = None):
+        self.cart = cart
+        self.expected_version = expected_version
+        self.changed_plan_ids: Set[int] = set()
+        self.removed_plan_ids: Set[int] = set()
+        # custom lines are addressed by food item id (cart_plan IS NULL)
+        self.changed_food_ids: Set[int] = set()
+        self.removed_food_ids: Set[int] = set()
+        self._foods: Dict[int, FoodItem] = {}
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(
+            self.changed_plan_ids
+            or self.removed_plan_ids
+            or self.changed_food_ids
+            or self.removed_food_ids
+        )
+
+    def _plans_changed(self, ids: Iterable[int]) -> None:
+        ids = set(ids)
+        self.changed_plan_ids |= ids
+        self.removed_plan_ids -= ids
+
+    def _plans_removed(self, ids: Iterable[int]) -> None:
+        ids = set(ids)
+        self.removed_plan_ids |= ids
+        self.changed_plan_ids -= ids
+
+    def _items_changed(self, food_ids: Iterable[int]) -> None:
+        food_ids = set(food_ids)
+        self.changed_food_ids |= food_ids
+        self.removed_food_ids -= food_ids
+
+    def _items_removed(self, food_ids: Iterable[int]) -> None:
+        food_ids = set(food_ids)
+        self.removed_food_ids |= food_ids
+        self.changed_food_ids -= food_ids
+
+    def prime_foods(self, food_items: Iterable[FoodItem]) -> None:
+        """Hand over FoodItems the caller already loaded so custom lines can be priced without re-reading them."""
+        for food_item in food_items:
+            self._foods[food_item.pk] = food_item
+
+    def _load_foods(self, food_ids: Iterable[int]) -> Dict[int, FoodItem]:
+        missing = set(food_ids) - set(self._foods)
+        if missing:
+            self._foods.update(FoodItem.objects.in_bulk(missing))
+        return self._foods
+
+    @abstractmethod
+    def commit(self) -> None: ...
+
+    @abstractmethod
+    def add_plan(
+        self,
+        meal_plan: MealPlan,
+        meals: Iterable[FoodItem],
+        quantity: int = 1,
+        merge: bool = False,
+    ) -> int: ...
+
+    @abstractmethod
+    def add_custom_items(self, quantities: Dict[int, int]) -> None: ...
+
+    @abstractmethod
+    def adjust_custom_item(self, food_item_id: int, change: int) -> bool: ...
+
+    @abstractmethod
+    def set_custom_quantities(self, quantities: Dict[int, int]) -> None: ...
+
+    @abstractmethod
+    def remove_plans(self, cart_plan_ids: Iterable[int]) -> List[int]: ...
+
+    @abstractmethod
+    def remove_custom_items(self, food_item_ids: Iterable[int]) -> List[int]: ...
+
+    def apply(
+        self,
+        operations: List[Dict[str, Any]],
+        meal_plans: Dict[int, MealPlan],
+        plan_meals: Dict[int, List[FoodItem]],
+    ) -> None:
+        """
+        Apply validated cart/batch/ operations in order. Consecutive operations of
+        the same kind are coalesced into one set-based statement group, so a batch
+        costs a handful of statements per run of operations rather than per item.
+        `meal_plans` / `plan_meals` are preloaded by the caller for add_plan.
+        Raises CartOperationError; run inside transaction.atomic() to roll back.
+        """
+        indexed = list(enumerate(operations))
+        for op, run in groupby(indexed, key=lambda pair: pair[1]["op"]):
+            run = list(run)
+            if op == "add_plan":
+                for _, data in run:
+                    self.add_plan(
+                        meal_plans[data["plan_id"]],
+                        plan_meals[data["plan_id"]],
+                        quantity=data["quantity"],
+                        merge=data["merge"],
+                    )
+            elif op == "set_item":
+                # later operations on the same food win, as if applied one by one
+                self.set_custom_quantities(
+                    {data["food_item"]: data["quantity"] for _, data in run}
+                )
+            elif op == "remove_plan":
+                missing = self.remove_plans(data["cart_plan_id"] for _, data in run)
+                if missing:
+                    index = next(i for i, d in run if d["cart_plan_id"] == missing[0])
+                    raise CartOperationError("CartPlan not found.", 404, index)
+            elif op == "remove_item":
+                missing = self.remove_custom_items(data["food_item"] for _, data in run)
+                if missing:
+                    index = next(i for i, d in run if d["food_item"] == missing[0])
+                    raise CartOperationError(
+                        "Item not found in custom items.", 404, index
+                    )
+
+
+class CartMutation(BaseCartMutation):
+    """
+    Set-based mutations of a Cart's rows. Besides bumping the version, `commit()`
+    applies the change the operations made to the cart's stored totals.
+    """
+
+    def __init__(self, cart: Cart, expected_version: Optional[int] = None):
+        super().__init__(cart, expected_version)
+        # change to the cart's stored totals, applied by commit()
+        self.totals_delta: Dict[str, Any] = empty_totals()
+        self._cleared = False  # totals restart from zero
+        self._recalculate = False  # totals are recomputed from the lines
+
+    @property
+    def has_changes(self) -> bool:
+        return super().has_changes or self._cleared
+
+    def _custom_changed(self, changes: Dict[int, int], lines: int = 0) -> None:
+        """Record custom quantity changes (food id -> +/- quantity) and +/- `lines` cart lines."""
+        changes = {fid: change for fid, change in changes.items() if change}
+        foods = self._load_foods(changes)
+        for fid, change in changes.items():
+            add_totals(self.totals_delta, food_totals(foods[fid], change))
+        self.totals_delta["item_count"] += lines
+
+    def _price_plans(self, cart_plans: List[CartPlan]) -> Dict[int, PlanLine]:
+        """Price existing CartPlans from their items (one query)."""
+        items = CartItem.objects.filter(cart_plan__in=cart_plans).select_related(
+            "food_item"
+        )
+        return {
+            line.cart_plan.pk: line
+            for line in price_lines(self.cart, cart_plans, items).plans
+        }
+
+    def _lock_cart(self) -> None:
+        """
+        Lock the cart row until the transaction ends. Taken before reading custom
+        lines that may be inserted, so concurrent first adds of the same food
+        can't both insert (the unique key doesn't cover NULL cart_plan).
+        """
+        list(
+            Cart.objects.select_for_update()
+            .filter(pk=self.cart.pk)
+            .values_list("pk", flat=True)
+        )
+
+    def _current_totals(self) -> Dict[str, Any]:
+        # drop any stale prefetch so the lines are read as they are now
+        getattr(self.cart, "_prefetched_objects_cache", {}).clear()
+        return price_cart(self.cart).totals()
+
+    def commit(self) -> None:
+        """
+        Bump the cart version and apply the change to the stored totals (one
+        UPDATE) if anything changed.
+        """
+        if not self.has_changes:
+            return
+        now = timezone.now()
+        updates: Dict[str, Any] = {"version": F("version") + 1, "updated_at": now}
+        if self._recalculate:
+            updates.update(self._current_totals())
+        else:
+            for name in TOTAL_FIELDS:
+                delta = quantize_total(self.totals_delta[name])
+                if self._cleared:
+                    updates[name] = delta
+                elif delta:
+                    updates[name] = F(name) + delta
+        carts = Cart.objects.filter(pk=self.cart.pk)
+        if self.expected_version is not None:
+            # optimistic concurrency: the version check and bump are one statement
+            carts = carts.filter(version=self.expected_version)
+        if not carts.update(**updates):
+            raise CartVersionConflict(
+                Cart.objects.filter(pk=self.cart.pk)
+                .values_list("version", flat=True)
+                .first()
+            )
+        self.cart.refresh_from_db(fields=["version", *TOTAL_FIELDS])
+        self.cart.updated_at = now
+
+    def add_plan(
+        self,
+        meal_plan: MealPlan,
+        meals: Iterable[FoodItem],
+        quantity: int = 1,
+        merge: bool = False,
+    ) -> int:
+        """
+        Add `quantity` copies of `meal_plan` (whose meals are `meals`) and return
+        the CartPlan id. With `merge`, an existing CartPlan for the same MealPlan
+        is bumped in a single UPDATE; otherwise a new CartPlan and its CartItems
+        are inserted in bulk.
+        """
+        existing: Optional[CartPlan] = None
+        if merge:
+            existing = CartPlan.objects.filter(
+                cart=self.cart, meal_plan=meal_plan
+            ).first()
+
+        if existing is not None:
+            CartPlan.objects.filter(pk=existing.pk).update(
+                quantity=F("quantity") + quantity
+            )
+            line = self._price_plans([existing])[existing.pk]
+            add_totals(self.totals_delta, plan_copy_totals(line), quantity)
+            self._plans_changed([existing.pk])
+            return existing.pk
+
+        # snapshot price from MealPlan if it exists (optional field on MealPlan)
+        cart_plan = CartPlan.objects.create(
+            cart=self.cart,
+            meal_plan=meal_plan,
+            quantity=quantity,
+            price=getattr(meal_plan, "price", None),
+        )
+        # one row per meal in the plan (quantity 1 each); uniqueness is
+        # (cart, food_item, cart_plan) so this won't clash with custom items
+        items = CartItem.objects.bulk_create(
+            CartItem(cart=self.cart, food_item=meal, quantity=1, cart_plan=cart_plan)
+            for meal in meals
+        )
+        line = price_lines(self.cart, [cart_plan], items).plans[0]
+        add_totals(self.totals_delta, line_totals(line))
+        self._plans_changed([cart_plan.pk])
+        return cart_plan.pk
+
+    def _custom_lines(self, food_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+        """Map food_item_id -> (CartItem id, quantity) for this cart's custom lines."""
+        return {
+            fid: (pk, qty)
+            for pk, fid, qty in CartItem.objects.filter(
+                cart=self.cart, cart_plan__isnull=True, food_item_id__in=food_ids
+            ).values_list("id", "food_item_id", "quantity")
+        }
+
+    def add_custom_items(self, quantities: Dict[int, int]) -> None:
+        """
+        Increment existing custom lines by the given quantities and insert the rest:
+        one SELECT, at most one UPDATE and one bulk INSERT for the whole selection.
+        """
+        quantities = {fid: qty for fid, qty in quantities.items() if qty > 0}
+        if not quantities:
+            return
+
+        self._lock_cart()
+        existing = self._custom_lines(quantities)
+        _bulk_increment(
+            CartItem, {pk: quantities[fid] for fid, (pk, _) in existing.items()}
+        )
+        CartItem.objects.bulk_create(
+            CartItem(cart=self.cart, food_item_id=fid, quantity=qty, cart_plan=None)
+            for fid, qty in quantities.items()
+            if fid not in existing
+        )
+        self._custom_changed(quantities, lines=len(quantities) - len(existing))
+        self._items_changed(quantities)
+
+    def adjust_custom_item(self, food_item_id: int, change: int) -> bool:
+        """
+        Apply a +/- `change` to the custom line for `food_item_id`: increments and
+        decrements of an existing line are single F() UPDATEs without row locks, a
+        line that would drop to zero is removed with a conditional DELETE, and only
+        a first add takes the cart lock to insert. Returns False when there was no
+        line to decrement; raises CartItemConflict if concurrent changes keep
+        winning the decrement.
+        """
+        lines = CartItem.objects.filter(
+            cart=self.cart, food_item_id=food_item_id, cart_plan__isnull=True
+        )
+        if change > 0:
+            created = 0
+            increment = {"quantity": F("quantity") + change}
+            if not lines.update(**increment):
+                # no line yet: check again under the cart lock before inserting
+                self._lock_cart()
+                if not lines.update(**increment):
+                    CartItem.objects.create(
+                        cart=self.cart,
+                        food_item_id=food_item_id,
+                        quantity=change,
+                        cart_plan=None,
+                    )
+                    created = 1
+            self._custom_changed({food_item_id: change}, lines=created)
+            self._items_changed([food_item_id])
+            return True
+        if change == 0:
+            return lines.exists()
+
+        # a concurrent tap can move the quantity between the statements, so retry
+        for _ in range(3):
+            if lines.filter(quantity__gt=-change).update(
+                quantity=F("quantity") + change
+            ):
+                self._custom_changed({food_item_id: change})
+                self._items_changed([food_item_id])
+                return True
+            # the line would drop to zero: delete it at the quantity we read so
+            # the totals come off by exactly what was removed
+            row = lines.values_list("id", "quantity").first()
+            if row is None:
+                return False
+            pk, quantity = row
+            if (
+                quantity <= -change
+                and lines.filter(pk=pk, quantity=quantity).delete()[0]
+            ):
+                self._custom_changed({food_item_id: -quantity}, lines=-1)
+                self._items_removed([food_item_id])
+                return True
+        raise CartItemConflict("Cart item changed concurrently, please retry.")
+
+    def set_custom_quantities(self, quantities: Dict[int, int]) -> None:
+        """
+        Set absolute quantities for custom lines (0 removes the line):
+        one SELECT, one DELETE, one CASE UPDATE and one bulk INSERT at most.
+        """
+        removed = [fid for fid, qty in quantities.items() if qty <= 0]
+        wanted = {fid: qty for fid, qty in quantities.items() if qty > 0}
+        if wanted:
+            self._lock_cart()
+        existing = self._custom_lines(quantities)
+
+        deleted = [fid for fid in removed if fid in existing]
+        if deleted:
+            CartItem.objects.filter(
+                pk__in=[existing[fid][0] for fid in deleted]
+            ).delete()
+        if removed:
+            self._items_removed(removed)
+
+        updated = {fid: qty for fid, qty in wanted.items() if fid in existing}
+        if updated:
+            CartItem.objects.filter(
+                pk__in=[existing[fid][0] for fid in updated]
+            ).update(
+                quantity=Case(
+                    *[
+                        When(pk=existing[fid][0], then=Value(qty))
+                        for fid, qty in updated.items()
+                    ],
+                    output_field=PositiveIntegerField(),
+                )
+            )
+        CartItem.objects.bulk_create(
+            CartItem(cart=self.cart, food_item_id=fid, quantity=qty, cart_plan=None)
+            for fid, qty in wanted.items()
+            if fid not in existing
+        )
+        self._custom_changed(
+            {
+                fid: max(qty, 0) - existing.get(fid, (None, 0))[1]
+                for fid, qty in quantities.items()
+            },
+            lines=len(wanted) - len(updated) - len(deleted),
+        )
+        self._items_changed(wanted)
+
+    def remove_plans(self, cart_plan_ids: Iterable[int]) -> List[int]:
+        """Delete the given CartPlans (and their items); return the ids that weren't in the cart."""
+        cart_plan_ids = set(cart_plan_ids)
+        plans = list(CartPlan.objects.filter(cart=self.cart, pk__in=cart_plan_ids))
+        found = {cart_plan.pk for cart_plan in plans}
+        if found:
+            for line in self._price_plans(plans).values():
+                add_totals(self.totals_delta, line_totals(line), -1)
+            # cascade will delete child CartItems
+            CartPlan.objects.filter(pk__in=found).delete()
+            self._plans_removed(found)
+        return sorted(cart_plan_ids - found)
+
+    def remove_custom_items(self, food_item_ids: Iterable[int]) -> List[int]:
+        """Delete custom lines for the given foods; return the food ids that weren't in the cart."""
+        food_item_ids = set(food_item_ids)
+        found = self._custom_lines(food_item_ids)
+        if found:
+            CartItem.objects.filter(pk__in=[pk for pk, _ in found.values()]).delete()
+            self._custom_changed(
+                {fid: -qty for fid, (_, qty) in found.items()}, lines=-len(found)
+            )
+            self._items_removed(found)
+        return sorted(food_item_ids - set(found))
+
+    def clear(self) -> None:
+        """
+        Delete every line of the cart (after checkout) and zero its totals.
+        Removed line ids aren't tracked, so this isn't meant for delta responses.
+        """
+        CartItem.objects.filter(cart=self.cart).delete()
+        CartPlan.objects.filter(cart=self.cart).delete()
+        self.totals_delta = empty_totals()
+        self._cleared = True
+
+    def merge_from(self, other: Cart) -> None:
+        """
+        Fold `other` (a guest cart) into this cart with set-based statements:
+        one read of each cart's plans and custom lines, CASE UPDATEs for the
+        quantities of overlapping lines and bulk cart reassignment for the rest.
+        Overlapping guest plans are left on `other`; the caller deletes it.
+        The stored totals are recomputed from the merged lines on commit().
+        """
+        carts = (self.cart.pk, other.pk)
+
+        plan_targets: Dict[int, int] = {}  # meal_plan_id -> CartPlan id in this cart
+        plan_deltas: Dict[int, int] = defaultdict(int)
+        moved_plan_ids = []
+        plans = CartPlan.objects.filter(cart_id__in=carts).order_by("id")
+        plan_rows = list(plans.values_list("id", "cart_id", "meal_plan_id", "quantity"))
+        for pk, cart_id, meal_plan_id, _ in plan_rows:
+            if cart_id == self.cart.pk:
+                plan_targets.setdefault(meal_plan_id, pk)
+        for pk, cart_id, meal_plan_id, quantity in plan_rows:
+            if cart_id != other.pk:
+                continue
+            if meal_plan_id in plan_targets:
+                plan_deltas[plan_targets[meal_plan_id]] += quantity
+            else:
+                # later guest copies of the same plan merge into the moved one
+                plan_targets[meal_plan_id] = pk
+                moved_plan_ids.append(pk)
+
+        item_targets: Dict[int, int] = (
+            {}
+        )  # food_item_id -> custom CartItem id in this cart
+        item_deltas: Dict[int, int] = defaultdict(int)
+        moved_item_ids = []
+        items = CartItem.objects.filter(cart_id__in=carts, cart_plan__isnull=True)
+        item_rows = list(
+            items.order_by("id").values_list(
+                "id", "cart_id", "food_item_id", "quantity"
+            )
+        )
+        for pk, cart_id, food_item_id, _ in item_rows:
+            if cart_id == self.cart.pk:
+                item_targets.setdefault(food_item_id, pk)
+        for pk, cart_id, food_item_id, quantity in item_rows:
+            if cart_id != other.pk:
+                continue
+            if food_item_id in item_targets:
+                item_deltas[item_targets[food_item_id]] += quantity
+            else:
+                item_targets[food_item_id] = pk
+                moved_item_ids.append(pk)
+
+        _bulk_increment(CartPlan, plan_deltas)
+        _bulk_increment(CartItem, item_deltas)
+        if moved_plan_ids:
+            CartPlan.objects.filter(pk__in=moved_plan_ids).update(cart=self.cart)
+            CartItem.objects.filter(cart_plan_id__in=moved_plan_ids).update(
+                cart=self.cart
+            )
+        if moved_item_ids:
+            CartItem.objects.filter(pk__in=moved_item_ids).update(cart=self.cart)
+
+        self._recalculate = True
+        self._plans_changed(set(plan_deltas) | set(moved_plan_ids))
+        self._items_changed(
+            fid
+            for fid, pk in item_targets.items()
+            if pk in item_deltas or pk in moved_item_ids
+        )
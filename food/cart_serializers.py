@@ -1,5 +1,7 @@
+from django.db.models import Q
 from rest_framework import serializers
 from .models import Cart, CartItem, CartPlan
+from .pricing import load_cart, price_cart, price_lines, price_plan
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -31,7 +33,7 @@ class CartItemSerializer(serializers.ModelSerializer):
 class CartPlanSerializer(serializers.ModelSerializer):
     meal_plan_title = serializers.CharField(source="meal_plan.__str__", read_only=True)
     computed_price = serializers.SerializerMethodField()
-    items = CartItemSerializer(many=True, read_only=True)
+    items = serializers.SerializerMethodField()
 
     class Meta:
         model = CartPlan
@@ -45,21 +47,171 @@ class CartPlanSerializer(serializers.ModelSerializer):
             "items",
         ]
 
+    def _line(self, obj):
+        # CartSerializer prices the whole (prefetched) cart once and shares it through the context
+        breakdown = self.context.get("cart_breakdown")
+        line = breakdown.plan_line(obj.pk) if breakdown else None
+        if line is None:
+            line = price_plan(obj, list(obj.items.select_related("food_item")))
+        return line
+
     def get_computed_price(self, obj):
-        return obj.computed_price()
+        return self._line(obj).total
+
+    def get_items(self, obj):
+        return CartItemSerializer(self._line(obj).items, many=True).data
+
+
+class CartTotalField(serializers.DecimalField):
+    """Reads the cart total from the breakdown computed by CartSerializer."""
+
+    def get_attribute(self, instance):
+        return self.context["cart_breakdown"].total
 
 
 class CartSerializer(serializers.ModelSerializer):
-    plans = CartPlanSerializer(many=True)
+    """
+    Renders a cart from the graph prefetched by `load_cart`: the cart row plus
+    two queries, however many plans and items it holds.
+    """
+
+    plans = serializers.SerializerMethodField()
     custom_items = serializers.SerializerMethodField()
+    total_price = CartTotalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = ["id", "user", "version", "plans", "custom_items", "total_price"]
+
+    def to_representation(self, instance):
+        self.context["cart_breakdown"] = price_cart(load_cart(instance))
+        return super().to_representation(instance)
+
+    def get_plans(self, obj):
+        breakdown = self.context["cart_breakdown"]
+        return CartPlanSerializer(
+            [line.cart_plan for line in breakdown.plans],
+            many=True,
+            context=self.context,
+        ).data
+
+    def get_custom_items(self, obj):
+        breakdown = self.context["cart_breakdown"]
+        return CartItemSerializer(breakdown.custom_items, many=True).data
+
+
+class CartDeltaSerializer(CartSerializer):
+    """
+    Opt-in mutation response: only the lines a CartMutation (passed as
+    context["mutation"]) touched, the ids it removed and the new totals.
+    Removed custom items are identified by food item id, like cart/remove-item/.
+    Only the touched lines are loaded; totals come from the cart row.
+    """
+
+    removed_plans = serializers.SerializerMethodField()
+    removed_custom_items = serializers.SerializerMethodField()
     total_price = serializers.DecimalField(
-        max_digits=12, decimal_places=2, read_only=True
+        source="subtotal", max_digits=12, decimal_places=2, read_only=True
     )
+    total_meals = serializers.IntegerField(source="meal_count", read_only=True)
 
     class Meta:
         model = Cart
-        fields = ["id", "user", "plans", "custom_items", "total_price"]
+        fields = [
+            "id",
+            "version",
+            "plans",
+            "custom_items",
+            "removed_plans",
+            "removed_custom_items",
+            "total_price",
+            "total_meals",
+        ]
 
-    def get_custom_items(self, obj):
-        qs = obj.items.filter(cart_plan__isnull=True)
-        return CartItemSerializer(qs, many=True).data
+    def to_representation(self, instance):
+        mutation = self.context["mutation"]
+        if instance.pk is None:
+            self.context["cart_breakdown"] = self._guest_lines(instance, mutation)
+            return super(CartSerializer, self).to_representation(instance)
+
+        plans = []
+        items = []
+        if mutation.changed_plan_ids:
+            plans = list(
+                CartPlan.objects.filter(
+                    cart=instance, pk__in=mutation.changed_plan_ids
+                ).select_related("meal_plan")
+            )
+        if mutation.changed_plan_ids or mutation.changed_food_ids:
+            items = CartItem.objects.filter(
+                Q(cart_plan_id__in=mutation.changed_plan_ids)
+                | Q(cart_plan__isnull=True, food_item_id__in=mutation.changed_food_ids),
+                cart=instance,
+            ).select_related("food_item")
+        self.context["cart_breakdown"] = price_lines(instance, plans, items)
+        return super(CartSerializer, self).to_representation(instance)
+
+    def _guest_lines(self, instance, mutation):
+        # cache-backed guest cart (food.guest_carts): the lines are in memory already
+        plans, items = instance.guest_cart.lines()
+        return price_lines(
+            instance,
+            [p for p in plans if p.pk in mutation.changed_plan_ids],
+            [
+                i
+                for i in items
+                if i.cart_plan_id in mutation.changed_plan_ids
+                or (
+                    i.cart_plan_id is None
+                    and i.food_item_id in mutation.changed_food_ids
+                )
+            ],
+        )
+
+    def get_removed_plans(self, obj):
+        return sorted(self.context["mutation"].removed_plan_ids)
+
+    def get_removed_custom_items(self, obj):
+        return sorted(self.context["mutation"].removed_food_ids)
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """One step of a cart/batch/ request."""
+
+    OP_ADD_PLAN = "add_plan"
+    OP_SET_ITEM = "set_item"
+    OP_REMOVE_PLAN = "remove_plan"
+    OP_REMOVE_ITEM = "remove_item"
+
+    REQUIRED_FIELDS = {
+        OP_ADD_PLAN: ("plan_id",),
+        OP_SET_ITEM: ("food_item", "quantity"),
+        OP_REMOVE_PLAN: ("cart_plan_id",),
+        OP_REMOVE_ITEM: ("food_item",),
+    }
+
+    op = serializers.ChoiceField(choices=list(REQUIRED_FIELDS))
+    plan_id = serializers.IntegerField(required=False)
+    cart_plan_id = serializers.IntegerField(required=False)
+    food_item = serializers.IntegerField(required=False)
+    # add_plan: copies of the plan (>= 1); set_item: new quantity (0 removes the line)
+    quantity = serializers.IntegerField(required=False, min_value=0)
+    merge = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        missing = [f for f in self.REQUIRED_FIELDS[data["op"]] if f not in data]
+        if missing:
+            raise serializers.ValidationError(
+                {f: f"This field is required for {data['op']}." for f in missing}
+            )
+        if data["op"] == self.OP_ADD_PLAN:
+            data.setdefault("quantity", 1)
+            if data["quantity"] <= 0:
+                raise serializers.ValidationError(
+                    {"quantity": "quantity must be a positive integer."}
+                )
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
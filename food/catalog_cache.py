@@ -0,0 +1,97 @@
+"""
+Versioned read-through cache for the public food catalog endpoints.
+
+Every cached payload is keyed by a global catalog version. Saving, deleting or
+re-assigning meals on a FoodItem/MealPlan bumps the version (see food/signals.py),
+so stale payloads are never read again and simply expire from the cache.
+"""
+
+import hashlib
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = "food:catalog:version"
+
+
+def _timeout() -> Optional[int]:
+    return getattr(settings, "CATALOG_CACHE_TIMEOUT", 60 * 60 * 24)
+
+
+def _seed_version() -> int:
+    # a fresh sequence starts from the clock in milliseconds, above any version
+    # an evicted key could have reached (bumps are far rarer than one per ms), so
+    # payloads cached under an older version are never read again
+    return int(time.time() * 1000)
+
+
+def get_catalog_version() -> int:
+    """Return the current catalog version, initialising it on first use."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        seed = _seed_version()
+        cache.add(CATALOG_VERSION_KEY, seed, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, seed)
+    return version
+
+
+def bump_catalog_version() -> None:
+    """Invalidate every cached catalog payload by moving to a new version."""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # key missing (cold cache or evicted) -> start a fresh, later sequence
+        cache.add(CATALOG_VERSION_KEY, _seed_version(), timeout=None)
+
+
+def catalog_cache_key(name: str, params: Dict[str, Any]) -> str:
+    filters = "&".join(f"{k}={params[k]}" for k in sorted(params) if params[k])
+    # query values are arbitrary client input: hash them into a key that is valid
+    # (and bounded) on every cache backend
+    digest = hashlib.sha1(filters.encode()).hexdigest()
+    return f"food:catalog:v{get_catalog_version()}:{name}:{digest}"
+
+
+def get_or_build(name: str, params: Dict[str, Any], build: Callable[[], Any]) -> Any:
+    """Return the cached payload for (name, params) or build and store it."""
+    key = catalog_cache_key(name, params)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=_timeout())
+    return data
+
+
+class CachedCatalogListMixin:
+    """
+    ListAPIView mixin that serves the serialized list from the catalog cache.
+    `catalog_cache_params` lists the query params that select a different payload;
+    `catalog_cache_values` optionally limits which of their values are cached, so
+    arbitrary values are served uncached instead of each adding a cache entry.
+    """
+
+    catalog_cache_name: str = ""
+    catalog_cache_params: Iterable[str] = ()
+    catalog_cache_values: Dict[str, Iterable[str]] = {}
+
+    def list(self, request, *args, **kwargs):
+        params = {p: request.GET.get(p) for p in self.catalog_cache_params}
+
+        def build():
+            queryset = self.filter_queryset(self.get_queryset())
+            # plain lists pickle cleanly into any cache backend
+            return list(self.get_serializer(queryset, many=True).data)
+
+        if not self.is_cacheable(params):
+            return Response(build())
+        name = self.catalog_cache_name or self.__class__.__name__
+        return Response(get_or_build(name, params, build))
+
+    def is_cacheable(self, params: Dict[str, Any]) -> bool:
+        return all(
+            not params.get(param) or params[param] in values
+            for param, values in self.catalog_cache_values.items()
+        )
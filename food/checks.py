@@ -0,0 +1,33 @@
+"""
+System checks for settings the food app relies on.
+"""
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# cache backends that aren't shared between worker processes
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Idempotency keys (and cache-backed guest carts) need a cache all workers share."""
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    uses = "Checkout Idempotency-Key handling"
+    if settings.GUEST_CART_STORE == "cache":
+        uses += ' and GUEST_CART_STORE = "cache"'
+    return [
+        Warning(
+            f"{uses} needs a cache shared by all workers, but the default cache "
+            f"is {backend.rsplit('.', 1)[-1]}: each process keeps its own copy, "
+            "so retries served by another worker are not recognised.",
+            hint="Set CACHE_BACKEND / CACHE_LOCATION to a shared backend such as "
+            "Redis or Memcached.",
+            id="food.W001",
+        )
+    ]
@@ -0,0 +1,288 @@
+"""
+Cache-backed guest carts.
+
+With GUEST_CART_STORE = "cache", a guest's cart lives in the default cache under
+their session key instead of in Cart/CartPlan/CartItem rows, so the (mostly
+abandoned) guest carts cost no database writes. Rows are only written when the
+cart has to become real: at checkout and when a guest logs in and their cart is
+merged into the user's (see `GuestCart.materialize`).
+
+Views use the same cart API either way: `GuestCart.as_cart()` returns an unsaved
+Cart that CartSerializer and price_cart render, and `mutation_for()` hands back a
+mutation with CartMutation's operations. Two concurrent requests from the same
+guest are last-writer-wins on the cache entry.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .cart_ops import BaseCartMutation, CartMutation, CartVersionConflict, ensure_cart
+from .models import Cart, CartItem, CartPlan, FoodItem, MealPlan
+from .pricing import empty_totals, price_lines
+
+GUEST_CART_KEY = "food:guest-cart:{session_key}"
+
+
+def cache_store_enabled() -> bool:
+    return settings.GUEST_CART_STORE == "cache"
+
+
+def _empty_state() -> Dict[str, Any]:
+    return {
+        "version": 0,
+        "next_id": 1,
+        "plans": [],
+        "items": {},
+        "totals": empty_totals(),
+    }
+
+
+class GuestCart:
+    """
+    A guest cart as kept in the cache:
+      plans: [{"id", "meal_plan_id", "quantity", "price", "items": [(id, food_item_id), ...]}]
+      items: {food_item_id: (id, quantity)} for custom lines
+      totals: the values Cart stores in food.pricing.TOTAL_FIELDS
+    Line ids come from "next_id" so clients address lines as they do rows.
+    """
+
+    def __init__(self, session_key: str, state: Optional[Dict[str, Any]] = None):
+        self.session_key = session_key
+        self.state = state if state is not None else _empty_state()
+        self._lines: Optional[Tuple[List[CartPlan], List[CartItem]]] = None
+
+    @staticmethod
+    def cache_key(session_key: str) -> str:
+        return GUEST_CART_KEY.format(session_key=session_key)
+
+    @classmethod
+    def load(cls, session_key: str) -> Optional["GuestCart"]:
+        state = cache.get(cls.cache_key(session_key))
+        if state is None:
+            return None
+        return cls(session_key, state)
+
+    def save(self) -> None:
+        cache.set(
+            self.cache_key(self.session_key),
+            self.state,
+            timeout=settings.GUEST_CART_TIMEOUT,
+        )
+
+    def delete(self) -> None:
+        cache.delete(self.cache_key(self.session_key))
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.state["plans"] and not self.state["items"]
+
+    def next_id(self) -> int:
+        pk = self.state["next_id"]
+        self.state["next_id"] += 1
+        return pk
+
+    def as_cart(self) -> Cart:
+        """Unsaved Cart carrying this guest cart's version and totals."""
+        cart = Cart(
+            session_key=self.session_key,
+            version=self.state["version"],
+            **self.state["totals"],
+        )
+        cart.guest_cart = self
+        return cart
+
+    def lines(self) -> Tuple[List[CartPlan], List[CartItem]]:
+        """
+        Unsaved CartPlans and CartItems for the current state; meal plans and food
+        items are read in two queries. Lines whose meal plan or food has since been
+        deleted are dropped, as the database cascade would.
+        """
+        if self._lines is not None:
+            return self._lines
+        plans = self.state["plans"]
+        meal_plans = MealPlan.objects.in_bulk({p["meal_plan_id"] for p in plans})
+        foods = FoodItem.objects.in_bulk(
+            {fid for p in plans for _, fid in p["items"]} | set(self.state["items"])
+        )
+
+        cart_plans = []
+        items = []
+        for plan in plans:
+            meal_plan = meal_plans.get(plan["meal_plan_id"])
+            if meal_plan is None:
+                continue
+            cart_plans.append(
+                CartPlan(
+                    id=plan["id"],
+                    meal_plan=meal_plan,
+                    quantity=plan["quantity"],
+                    price=plan["price"],
+                )
+            )
+            items.extend(
+                CartItem(
+                    id=pk, food_item=foods[fid], quantity=1, cart_plan_id=plan["id"]
+                )
+                for pk, fid in plan["items"]
+                if fid in foods
+            )
+        items.extend(
+            CartItem(id=pk, food_item=foods[fid], quantity=qty)
+            for fid, (pk, qty) in self.state["items"].items()
+            if fid in foods
+        )
+        self._lines = (cart_plans, items)
+        return self._lines
+
+    def materialize(self, into: Optional[Cart] = None) -> Cart:
+        """
+        Write this cart into database rows and drop the cache entry once they are
+        committed. With `into` (the user's cart on login) plans and foods merge
+        into existing lines like merge_guest_cart_to_user; otherwise the guest's
+        session Cart receives them.
+        """
+        cart = into
+        if cart is None:
+            cart = ensure_cart(session_key=self.session_key)
+        cart_plans, items = self.lines()
+        plan_meals: Dict[int, List[FoodItem]] = defaultdict(list)
+        custom: Dict[int, int] = {}
+        for item in items:
+            if item.cart_plan_id is None:
+                custom[item.food_item_id] = item.quantity
+            else:
+                plan_meals[item.cart_plan_id].append(item.food_item)
+
+        mutation = CartMutation(cart)
+        mutation.prime_foods(item.food_item for item in items)
+        with transaction.atomic():
+            for cart_plan in cart_plans:
+                mutation.add_plan(
+                    cart_plan.meal_plan,
+                    plan_meals[cart_plan.pk],
+                    quantity=cart_plan.quantity,
+                    merge=into is not None,
+                )
+            mutation.add_custom_items(custom)
+            mutation.commit()
+            # keep the cache entry if an enclosing transaction (checkout) rolls back
+            transaction.on_commit(self.delete)
+        return cart
+
+
+class GuestCartMutation(BaseCartMutation):
+    """CartMutation's operations applied to a cache-backed guest cart."""
+
+    def __init__(self, cart: Cart, expected_version: Optional[int] = None):
+        super().__init__(cart, expected_version)
+        self.guest_cart: GuestCart = cart.guest_cart
+        self.state = self.guest_cart.state
+
+    def commit(self) -> None:
+        """Bump the version, re-price the cart and write it back to the cache."""
+        if not self.has_changes:
+            return
+        if self.expected_version is not None:
+            # best effort: the cache has no compare-and-set, so this narrows the
+            # race to the read below instead of closing it like the DB store
+            stored = cache.get(GuestCart.cache_key(self.guest_cart.session_key))
+            current_version = stored["version"] if stored else 0
+            if current_version != self.expected_version:
+                raise CartVersionConflict(current_version)
+        self.state["version"] += 1
+        self.guest_cart._lines = None
+        self.state["totals"] = price_lines(self.cart, *self.guest_cart.lines()).totals()
+        self.guest_cart.save()
+
+        self.cart.version = self.state["version"]
+        for name, value in self.state["totals"].items():
+            setattr(self.cart, name, value)
+        self.cart.updated_at = timezone.now()
+
+    def add_plan(
+        self,
+        meal_plan: MealPlan,
+        meals: Iterable[FoodItem],
+        quantity: int = 1,
+        merge: bool = False,
+    ) -> int:
+        if merge:
+            for plan in self.state["plans"]:
+                if plan["meal_plan_id"] == meal_plan.pk:
+                    plan["quantity"] += quantity
+                    self._plans_changed([plan["id"]])
+                    return plan["id"]
+
+        plan = {
+            "id": self.guest_cart.next_id(),
+            "meal_plan_id": meal_plan.pk,
+            "quantity": quantity,
+            "price": getattr(meal_plan, "price", None),
+            "items": [(self.guest_cart.next_id(), meal.pk) for meal in meals],
+        }
+        self.state["plans"].append(plan)
+        self._plans_changed([plan["id"]])
+        return plan["id"]
+
+    def _quantity(self, food_item_id: int) -> int:
+        line = self.state["items"].get(food_item_id)
+        return line[1] if line else 0
+
+    def _set_quantity(self, food_item_id: int, quantity: int) -> None:
+        items = self.state["items"]
+        if quantity <= 0:
+            items.pop(food_item_id, None)
+            self._items_removed([food_item_id])
+            return
+        line = items.get(food_item_id)
+        pk = line[0] if line else self.guest_cart.next_id()
+        items[food_item_id] = (pk, quantity)
+        self._items_changed([food_item_id])
+
+    def add_custom_items(self, quantities: Dict[int, int]) -> None:
+        for fid, qty in quantities.items():
+            if qty > 0:
+                self._set_quantity(fid, self._quantity(fid) + qty)
+
+    def adjust_custom_item(self, food_item_id: int, change: int) -> bool:
+        exists = food_item_id in self.state["items"]
+        if change == 0 or (change < 0 and not exists):
+            return exists
+        self._set_quantity(food_item_id, self._quantity(food_item_id) + change)
+        return True
+
+    def set_custom_quantities(self, quantities: Dict[int, int]) -> None:
+        for fid, qty in quantities.items():
+            self._set_quantity(fid, qty)
+
+    def remove_plans(self, cart_plan_ids: Iterable[int]) -> List[int]:
+        cart_plan_ids = set(cart_plan_ids)
+        plans = self.state["plans"]
+        found = {plan["id"] for plan in plans if plan["id"] in cart_plan_ids}
+        if found:
+            self.state["plans"] = [plan for plan in plans if plan["id"] not in found]
+            self._plans_removed(found)
+        return sorted(cart_plan_ids - found)
+
+    def remove_custom_items(self, food_item_ids: Iterable[int]) -> List[int]:
+        food_item_ids = set(food_item_ids)
+        found = food_item_ids & set(self.state["items"])
+        for fid in found:
+            del self.state["items"][fid]
+        if found:
+            self._items_removed(found)
+        return sorted(food_item_ids - found)
+
+
+def mutation_for(
+    cart: Cart, expected_version: Optional[int] = None
+) -> BaseCartMutation:
+    """The mutation class for the store `cart` lives in."""
+    if getattr(cart, "guest_cart", None) is not None:
+        return GuestCartMutation(cart, expected_version)
+    return CartMutation(cart, expected_version)
@@ -0,0 +1,217 @@
+"""
+Idempotency-Key support for endpoints that must not run twice (checkout).
+
+A client sends a unique `Idempotency-Key` header with a request and reuses it when
+retrying. The first request takes a short "pending" lock on the key in the default
+cache (an atomic cache.add) and runs; its response is stored under the key for
+IDEMPOTENCY_KEY_TIMEOUT seconds. A retry in that window gets the stored response
+back (marked with `Idempotent-Replayed: true`) without re-running the view, and a
+retry while the first request is still running gets a 409 it can back off from.
+Reusing a key with a different body is rejected with 422.
+
+Keys are scoped to the user (or guest session) and the endpoint; a guest
+without a session has no scope to keep them in, so the header is ignored.
+Responses are stored once the view created something (any response carrying an
+order `reference`) or returned a 4xx (e.g. an empty cart); a 5xx without an order,
+or an exception (including a serializer validation error), releases the key so
+the client can retry with it. A view that commits an order before its last step
+calls `mark_created` from transaction.on_commit: the key then replays that order
+(202) even if the rest of the request fails or never finishes, and a retry can't
+run the view again on the now-empty cart.
+
+Like cache-backed guest carts, this needs a cache shared by all workers (see the
+food.W001 system check).
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_CACHE_KEY = "food:idempotency:{scope}:{key}"
+MAX_KEY_LENGTH = 255
+
+PENDING = "pending"
+DONE = "done"
+
+# response headers worth replaying with the stored body
+REPLAYED_HEADERS = ("ETag", "Retry-After")
+
+
+def _fingerprint(request) -> str:
+    data = request.data
+    if hasattr(data, "lists"):
+        # QueryDict (form posts): keep repeated fields
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(
+        f"{request.method} {request.path}\n{body}".encode()
+    ).hexdigest()
+
+
+class IdempotentRequest:
+    """The idempotency record for one request that carried an Idempotency-Key."""
+
+    def __init__(self, request, endpoint: str, key: str, owner: str):
+        self.created = False
+        self.finished = False
+        self.cache_key = IDEMPOTENCY_CACHE_KEY.format(
+            scope=f"{endpoint}:{owner}", key=hashlib.sha256(key.encode()).hexdigest()
+        )
+        self.fingerprint = _fingerprint(request)
+
+    @classmethod
+    def from_request(cls, request, endpoint: str) -> Optional["IdempotentRequest"]:
+        key = request.headers.get(IDEMPOTENCY_HEADER, "").strip()
+        if not key:
+            return None
+        owner = cls.owner(request)
+        if owner is None:
+            return None
+        return cls(request, endpoint, key, owner)
+
+    @staticmethod
+    def owner(request) -> Optional[str]:
+        """Scope for the request's keys: the user, else the guest's session."""
+        user = request.user
+        if user.is_authenticated:
+            return f"user-{user.pk}"
+        if request.session.session_key:
+            return f"session-{request.session.session_key}"
+        # session-less guests would all share one scope and see each other's
+        # responses
+        return None
+
+    def begin(self) -> Optional[Response]:
+        """
+        Claim the key. Returns None when the caller should run the view, or the
+        response to answer with instead (a replay or a conflict).
+        """
+        pending = {"state": PENDING, "fingerprint": self.fingerprint}
+        if cache.add(
+            self.cache_key, pending, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT
+        ):
+            return None
+
+        record = cache.get(self.cache_key)
+        if record is None:
+            # expired between add() and get(); try once more
+            if cache.add(
+                self.cache_key, pending, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT
+            ):
+                return None
+            record = cache.get(self.cache_key) or pending
+
+        if record["fingerprint"] != self.fingerprint:
+            return Response(
+                {"error": "Idempotency-Key was already used with a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if record["state"] == PENDING:
+            response = Response(
+                {
+                    "error": "A request with this Idempotency-Key is still in progress.",
+                    "retryable": True,
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+            response["Retry-After"] = "1"
+            return response
+        return self._replay(record)
+
+    def _replay(self, record: Dict[str, Any]) -> Response:
+        response = Response(record["data"], status=record["status"])
+        for name, value in record["headers"].items():
+            response[name] = value
+        response["Idempotent-Replayed"] = "true"
+        return response
+
+    def _store(self, status_code: int, data: Any, headers: Dict[str, str]) -> None:
+        cache.set(
+            self.cache_key,
+            {
+                "state": DONE,
+                "fingerprint": self.fingerprint,
+                "status": status_code,
+                "data": data,
+                "headers": headers,
+            },
+            timeout=settings.IDEMPOTENCY_KEY_TIMEOUT,
+        )
+
+    def mark_created(self, data: Dict[str, Any]) -> None:
+        """Replay `data` (with 202) from now on, until finish() stores the final response."""
+        self.created = True
+        if self.finished:
+            # the commit came after the view returned (an enclosing transaction);
+            # keep the response finish() stored
+            return
+        self._store(status.HTTP_202_ACCEPTED, data, {})
+
+    def finish(self, response: Response) -> Response:
+        """Store `response` for replays, or free the key if it is worth retrying."""
+        self.finished = True
+        data = response.data
+        created = isinstance(data, dict) and "reference" in data
+        if response.status_code >= 500 and not created:
+            if not self.created:
+                self.release()
+            # else keep replaying the order mark_created recorded
+            return response
+        self._store(
+            response.status_code,
+            data,
+            {
+                name: response[name]
+                for name in REPLAYED_HEADERS
+                if response.has_header(name)
+            },
+        )
+        return response
+
+    def release(self) -> None:
+        cache.delete(self.cache_key)
+
+
+def mark_created(request, data: Dict[str, Any]) -> None:
+    """
+    Record that the request committed what `data` describes (an order's
+    `reference`), if it runs under an Idempotency-Key. Call it from
+    transaction.on_commit.
+    """
+    idempotent = getattr(request, "idempotency", None)
+    if idempotent is not None:
+        idempotent.mark_created(data)
+
+
+def run_idempotent(request, endpoint: str, view) -> Response:
+    """
+    Run `view()` under the request's Idempotency-Key, if it sent one. Keys longer
+    than MAX_KEY_LENGTH are rejected.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER, "")
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    idempotent = IdempotentRequest.from_request(request, endpoint)
+    if idempotent is None:
+        return view()
+
+    early = idempotent.begin()
+    if early is not None:
+        return early
+    request.idempotency = idempotent
+    try:
+        response = view()
+    except Exception:
+        if not idempotent.created:
+            idempotent.release()
+        raise
+    return idempotent.finish(response)
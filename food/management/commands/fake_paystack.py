@@ -0,0 +1,127 @@
+"""
+Django management command to run a local fake Paystack API
+"""
+
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+
+from django.core.management.base import BaseCommand
+
+
+class FakePaystackHandler(BaseHTTPRequestHandler):
+    # set by the command before serving
+    latency = 0.0
+    fail_rate = 0.0
+    amounts = {}
+    lock = Lock()
+
+    def _respond(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _simulate_gateway(self):
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            self._respond(503, {"status": False, "message": "Service unavailable"})
+            return False
+        return True
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/transaction/initialize":
+            return self._respond(404, {"status": False, "message": "Not found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self._simulate_gateway():
+            return
+        reference = body.get("reference") or uuid.uuid4().hex
+        with self.lock:
+            self.amounts[reference] = body.get("amount", 0)
+        host = self.headers.get("Host", "localhost")
+        self._respond(
+            200,
+            {
+                "status": True,
+                "message": "Authorization URL created",
+                "data": {
+                    "authorization_url": f"http://{host}/checkout/{reference}",
+                    "access_code": uuid.uuid4().hex[:12],
+                    "reference": reference,
+                },
+            },
+        )
+
+    def do_GET(self):
+        prefix = "/transaction/verify/"
+        if not self.path.startswith(prefix):
+            return self._respond(404, {"status": False, "message": "Not found"})
+        if not self._simulate_gateway():
+            return
+        reference = self.path[len(prefix) :].strip("/")
+        with self.lock:
+            amount = self.amounts.get(reference)
+        if amount is None:
+            return self._respond(
+                400, {"status": False, "message": "Transaction reference not found"}
+            )
+        self._respond(
+            200,
+            {
+                "status": True,
+                "message": "Verification successful",
+                "data": {"reference": reference, "amount": amount, "status": "success"},
+            },
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a fake Paystack API (transaction/initialize and transaction/verify) "
+        "with configurable latency, for load-testing checkout locally. Point "
+        "PAYSTACK_BASE_URL at it, e.g. PAYSTACK_BASE_URL=http://127.0.0.1:8765"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+        parser.add_argument("--port", type=int, default=8765, help="Port to bind")
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=1.0,
+            help="Seconds every call takes, to mimic a slow gateway",
+        )
+        parser.add_argument(
+            "--fail-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of calls (0-1) answered with a 503",
+        )
+
+    def handle(self, *args, **options):
+        FakePaystackHandler.latency = options["latency"]
+        FakePaystackHandler.fail_rate = options["fail_rate"]
+        server = ThreadingHTTPServer(
+            (options["host"], options["port"]), FakePaystackHandler
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Fake Paystack listening on http://{options['host']}:{options['port']} "
+                f"(latency {options['latency']}s, fail rate {options['fail_rate']})"
+            )
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
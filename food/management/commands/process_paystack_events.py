@@ -0,0 +1,59 @@
+"""
+Django management command to apply Paystack webhook events from the inbox
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from food.paystack_webhook import process_pending_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply pending Paystack webhook events (charge.success marks the order "
+        "paid). Run it from cron, or with --loop as a long-running worker; several "
+        "workers can run at once"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Maximum events processed per pass",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=5,
+            help="Stop retrying an event after this many failed attempts",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the inbox instead of exiting after one pass",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait between passes when the inbox is empty (--loop)",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed, failed = process_pending_events(
+                batch_size=options["batch_size"],
+                max_attempts=options["max_attempts"],
+            )
+            if processed or failed or not options["loop"]:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Processed {processed} events, {failed} failed."
+                    )
+                )
+            if not options["loop"]:
+                return
+            if processed + failed < options["batch_size"]:
+                time.sleep(options["interval"])
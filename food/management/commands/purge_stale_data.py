@@ -0,0 +1,125 @@
+"""
+Django management command to purge abandoned guest carts, expired sessions and
+spent password reset OTPs
+"""
+
+import time
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import PasswordResetOTP
+from food.models import Cart
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stale guest carts (with their plans and items), expired sessions "
+        "and used/expired password reset OTPs in small primary-key batches, so it "
+        "can run from cron while the site is live"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cart-days",
+            type=int,
+            default=30,
+            help="Delete guest carts not updated for this many days",
+        )
+        parser.add_argument(
+            "--otp-days",
+            type=int,
+            default=1,
+            help="Delete OTPs used or expired more than this many days ago",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Maximum rows deleted per statement",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.1,
+            help="Seconds to sleep between batches to leave room for live traffic",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count what would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.pause = options["pause"]
+        self.dry_run = options["dry_run"]
+        now = timezone.now()
+
+        otp_cutoff = now - timedelta(days=options["otp_days"])
+        targets = [
+            (
+                "guest carts",
+                Cart.objects.filter(
+                    user__isnull=True,
+                    updated_at__lt=now - timedelta(days=options["cart_days"]),
+                ),
+            ),
+            ("sessions", Session.objects.filter(expire_date__lt=now)),
+            (
+                "password reset OTPs",
+                PasswordResetOTP.objects.filter(
+                    Q(expires_at__lt=otp_cutoff)
+                    | Q(used=True, created_at__lt=otp_cutoff)
+                ),
+            ),
+        ]
+
+        for label, queryset in targets:
+            total = self.purge(label, queryset)
+            verb = "would be deleted" if self.dry_run else "deleted"
+            self.stdout.write(self.style.SUCCESS(f"{label}: {total} {verb}"))
+
+    def purge(self, label, queryset):
+        """
+        Walk `queryset` in primary-key order. Each batch reads the next
+        `batch_size` matching keys, then deletes the matching rows inside that key
+        range, so every DELETE touches a bounded, index-ordered slice of the table.
+        The filter is re-applied on delete, so rows touched in between survive.
+        """
+        total = 0
+        batch = 0
+        last_pk = None
+        while True:
+            pending = queryset.order_by("pk")
+            if last_pk is not None:
+                pending = pending.filter(pk__gt=last_pk)
+            pks = list(pending.values_list("pk", flat=True)[: self.batch_size])
+            if not pks:
+                return total
+
+            batch += 1
+            started = time.monotonic()
+            if self.dry_run:
+                count = len(pks)
+            else:
+                # rows counted by delete() include cascaded children; report ours
+                count = (
+                    queryset.filter(pk__gte=pks[0], pk__lte=pks[-1])
+                    .delete()[1]
+                    .get(queryset.model._meta.label, 0)
+                )
+            elapsed_ms = (time.monotonic() - started) * 1000
+            total += count
+            last_pk = pks[-1]
+            self.stdout.write(
+                f"{label}: batch {batch} - {count} rows "
+                f"(pk {pks[0]}..{pks[-1]}) in {elapsed_ms:.1f} ms"
+            )
+            if len(pks) < self.batch_size:
+                return total
+            if self.pause:
+                time.sleep(self.pause)
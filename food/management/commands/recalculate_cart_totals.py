@@ -0,0 +1,89 @@
+"""
+Django management command to recompute the denormalized cart totals
+"""
+
+from typing import Any, Dict, List, Tuple
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from food.models import Cart, CartItem, CartPlan
+from food.pricing import price_cart, stored_totals
+
+# passes over carts whose version moved while they were being re-priced
+RETRIES = 3
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute each cart's stored totals from its lines and fix any drift "
+        "(e.g. after menu price changes)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of carts loaded per batch",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drifted carts without updating them",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+
+        carts = Cart.objects.order_by("pk").prefetch_related(
+            Prefetch("plans", queryset=CartPlan.objects.select_related("meal_plan")),
+            Prefetch("items", queryset=CartItem.objects.select_related("food_item")),
+        )
+        checked = drifted = skipped = 0
+        last_pk = 0
+        while True:
+            batch = list(carts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            checked += len(batch)
+
+            for attempt in range(RETRIES):
+                stale = self.stale_totals(batch)
+                if dry_run:
+                    drifted += len(stale)
+                    break
+                # a mutation committed since the read may have applied its own
+                # F() deltas; only write carts still at the version we priced
+                changed = []
+                for cart, totals in stale:
+                    if Cart.objects.filter(pk=cart.pk, version=cart.version).update(
+                        **totals
+                    ):
+                        drifted += 1
+                    else:
+                        changed.append(cart.pk)
+                if not changed:
+                    break
+                if attempt == RETRIES - 1:
+                    skipped += len(changed)
+                else:
+                    batch = list(carts.filter(pk__in=changed))
+
+        verb = "would be fixed" if dry_run else "fixed"
+        message = f"Checked {checked} carts, {drifted} {verb}."
+        if skipped:
+            message += f" {skipped} kept changing and were skipped; run again."
+        self.stdout.write(self.style.SUCCESS(message))
+
+    @staticmethod
+    def stale_totals(carts: List[Cart]) -> List[Tuple[Cart, Dict[str, Any]]]:
+        """The carts whose stored totals differ from their lines, with the right totals."""
+        stale = []
+        for cart in carts:
+            totals = price_cart(cart).totals()
+            if totals != stored_totals(cart):
+                stale.append((cart, totals))
+        return stale
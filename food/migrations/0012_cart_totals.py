@@ -0,0 +1,131 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:28
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 500
+
+MACRO_FIELDS = ('calories', 'protein', 'carbohydrates', 'fat')
+TOTAL_FIELDS = ('subtotal', 'item_count', 'meal_count', *MACRO_FIELDS)
+
+
+def cart_totals(plans, items):
+    # frozen copy of food.pricing's price_cart(cart).totals() as of this
+    # migration: a plan line counts its snapshot price (or its meals' prices)
+    # and its meals' macros per copy, one line and its meals' quantities;
+    # a custom line counts price and macros per unit, one line and its quantity
+    totals = {name: Decimal(0) for name in TOTAL_FIELDS}
+    totals['item_count'] = totals['meal_count'] = 0
+
+    def add_macros(food_item, quantity):
+        for name in MACRO_FIELDS:
+            totals[name] += Decimal(str(getattr(food_item, name) or 0)) * quantity
+
+    items_by_plan = defaultdict(list)
+    for item in items:
+        items_by_plan[item.cart_plan_id].append(item)
+
+    for cart_plan in plans:
+        plan_items = items_by_plan.get(cart_plan.pk, [])
+        unit_price = cart_plan.price
+        if unit_price is None:
+            unit_price = sum(
+                (item.food_item.price * item.quantity for item in plan_items),
+                Decimal(0),
+            )
+        totals['subtotal'] += unit_price * cart_plan.quantity
+        for item in plan_items:
+            add_macros(item.food_item, item.quantity * cart_plan.quantity)
+        totals['item_count'] += 1
+        totals['meal_count'] += sum(item.quantity for item in plan_items)
+
+    for item in items_by_plan.get(None, []):
+        totals['subtotal'] += item.food_item.price * item.quantity
+        add_macros(item.food_item, item.quantity)
+        totals['item_count'] += 1
+        totals['meal_count'] += item.quantity
+
+    return {
+        name: value.quantize(Decimal('0.01')) if isinstance(value, Decimal) else value
+        for name, value in totals.items()
+    }
+
+
+def backfill_cart_totals(apps, schema_editor):
+    # price every existing cart from its lines so the new columns don't start
+    # at zero; carts in pk batches, each committed on its own
+    Cart = apps.get_model('food', 'Cart')
+    CartPlan = apps.get_model('food', 'CartPlan')
+    CartItem = apps.get_model('food', 'CartItem')
+    last_pk = 0
+    while True:
+        batch = list(Cart.objects.filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        plans = defaultdict(list)
+        for cart_plan in CartPlan.objects.filter(cart__in=batch).order_by('pk'):
+            plans[cart_plan.cart_id].append(cart_plan)
+        items = defaultdict(list)
+        for item in CartItem.objects.filter(cart__in=batch).select_related(
+            'food_item'
+        ):
+            items[item.cart_id].append(item)
+
+        for cart in batch:
+            totals = cart_totals(plans[cart.pk], items[cart.pk])
+            for name, value in totals.items():
+                setattr(cart, name, value)
+        with transaction.atomic(using=schema_editor.connection.alias):
+            Cart.objects.bulk_update(batch, TOTAL_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('food', '0011_cart_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='calories',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='carbohydrates',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='fat',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='meal_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='protein',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:33
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def drop_duplicate_session_carts(apps, schema_editor):
+    # MySQL never enforced the conditional constraint, so racing requests could
+    # create several carts per session; keep the most recently updated one
+    Cart = apps.get_model('food', 'Cart')
+    duplicated = (
+        Cart.objects.exclude(session_key=None)
+        .values('session_key')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+        .values_list('session_key', flat=True)
+    )
+    for session_key in list(duplicated):
+        carts = Cart.objects.filter(session_key=session_key).order_by('-updated_at', '-id')
+        keep = carts.values_list('id', flat=True).first()
+        carts.exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0012_cart_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_session_carts, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='cart',
+            name='unique_session_cart',
+        ),
+        migrations.AlterField(
+            model_name='cart',
+            name='session_key',
+            field=models.CharField(blank=True, max_length=40, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.6 on 2026-10-17 09:12
+
+import json
+from decimal import Decimal
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 500
+
+# frozen copy of the version 2 format from food.snapshots as of this migration
+SNAPSHOT_VERSION = 2
+LEGACY_TYPES = {'meal_plan': 'p', 'custom_item': 'c'}
+
+
+def to_kobo(amount):
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1')))
+
+
+def from_legacy_line(line):
+    line_type = LEGACY_TYPES.get(line.get('type'), 'c')
+    if line_type == 'p':
+        object_id, name = line.get('meal_plan_id'), line.get('title')
+    else:
+        object_id, name = line.get('food_item_id'), line.get('name')
+    return {
+        't': line_type,
+        'id': object_id,
+        'n': name or '',
+        'q': line.get('quantity') or 0,
+        'u': to_kobo(line.get('unit_price') or 0),
+        'x': to_kobo(line.get('line_total') or 0),
+    }
+
+
+def read_snapshot(raw):
+    # a v2 dict, a legacy list of lines, either double-encoded as a JSON
+    # string, or nothing
+    if isinstance(raw, (str, bytes)):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raw = None
+    if isinstance(raw, dict) and raw.get('v') == SNAPSHOT_VERSION:
+        return raw
+    lines = []
+    if isinstance(raw, list):
+        lines = [from_legacy_line(line) for line in raw if isinstance(line, dict)]
+    return {'v': SNAPSHOT_VERSION, 'lines': lines}
+
+
+def rewrite_order_snapshots(apps, schema_editor):
+    # checkout used to json.dumps() the snapshot into the JSON column, storing a
+    # JSON string; convert those (and native legacy lists) to the v2 format in
+    # primary-key batches, each committed on its own
+    Order = apps.get_model('food', 'Order')
+    last_pk = 0
+    while True:
+        batch = list(
+            Order.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .only('pk', 'items_snapshot')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        stale = []
+        for order in batch:
+            raw = order.items_snapshot
+            if isinstance(raw, dict) and raw.get('v') == SNAPSHOT_VERSION:
+                continue
+            order.items_snapshot = read_snapshot(raw)
+            stale.append(order)
+        if stale:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                Order.objects.bulk_update(stale, ['items_snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('food', '0013_cart_session_key_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(rewrite_order_snapshots, migrations.RunPython.noop),
+    ]
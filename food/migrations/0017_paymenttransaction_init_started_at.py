@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0016_paystackevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='init_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
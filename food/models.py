@@ -1,9 +1,10 @@
 import json
 from typing import TYPE_CHECKING
 import uuid
+from datetime import timedelta
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.utils.text import slugify
 from decimal import Decimal
 from django.db.models.manager import Manager
@@ -198,11 +199,9 @@ class CartPlan(models.Model):
         """
         if self.price is not None:
             return self.price * self.quantity
-        items_total = sum(
-            (item.food_item.price * item.quantity)
-            for item in CartItem.objects.filter(cart_plan=self)
-        )
-        return Decimal(items_total) * Decimal(self.quantity)
+        from .pricing import price_plan
+
+        return price_plan(self, list(self.items.select_related("food_item"))).total
 
 
 class Cart(models.Model):
@@ -211,11 +210,25 @@ class Cart(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True
     )
-    # For guest sessions - use session key or temporary identifier
-    session_key = models.CharField(max_length=40, null=True, blank=True)
+    # For guest sessions - use session key or temporary identifier.
+    # A plain unique index (NULLs don't collide) rather than a conditional
+    # constraint, which MySQL doesn't enforce; cart creation relies on it.
+    session_key = models.CharField(max_length=40, null=True, blank=True, unique=True)
     # Guest contact info (optional, for pre-filling checkout)
     guest_email = models.EmailField(null=True, blank=True)
     guest_phone = models.CharField(max_length=64, null=True, blank=True)
+    # bumped by every cart mutation (food.cart_ops.CartMutation.commit)
+    version = models.PositiveIntegerField(default=0)
+    # Denormalized totals (food.pricing.TOTAL_FIELDS), kept in step by CartMutation
+    # in the same transaction as each change. Menu price edits aren't propagated:
+    # `manage.py recalculate_cart_totals` repairs drift, checkout always re-prices.
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)  # plans + custom lines
+    meal_count = models.PositiveIntegerField(default=0)  # sum of CartItem quantities
+    calories = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    protein = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    carbohydrates = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    fat = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -225,29 +238,22 @@ class Cart(models.Model):
         return f"Guest Cart ({self.session_key})"
 
     class Meta:
-        # Ensure one cart per user OR one cart per session_key
+        # Ensure one cart per user OR one cart per session_key (session_key is unique)
         constraints = [
             models.UniqueConstraint(
                 fields=["user"],
                 condition=models.Q(user__isnull=False),
                 name="unique_user_cart",
             ),
-            models.UniqueConstraint(
-                fields=["session_key"],
-                condition=models.Q(session_key__isnull=False),
-                name="unique_session_cart",
-            ),
         ]
 
     @property
     def total_price(self):
-        # Sum plan-level totals first (CartPlan may have snapshot price)
-        plan_total = sum(plan.computed_price() for plan in self.plans.all())
-        # Sum of custom items only (items where cart_plan is None)
-        custom_total = sum(
-            item.total_price for item in self.items.filter(cart_plan__isnull=True)
-        )
-        return plan_total + custom_total
+        # Plan totals (CartPlan may have snapshot price) + custom items, priced in two queries.
+        # Callers that need more than the total should use food.pricing.price_cart directly.
+        from .pricing import price_cart
+
+        return price_cart(self).total
 
     @property
     def total_calories(self):
@@ -316,10 +322,26 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # order history: filter by user, newest first, keyset on (created_at, id)
+            models.Index(
+                fields=["user", "created_at", "id"], name="order_user_created_idx"
+            ),
+            # admin changelist: status filter with created_at filter/ordering
+            models.Index(
+                fields=["status", "created_at"], name="order_status_created_idx"
+            ),
+        ]
+
     def mark_paid(self):
         self.status = self.STATUS_PAID
         self.save(update_fields=["status", "updated_at"])
+        # the receipt goes out once the payment is committed, not while the
+        # caller (food.payments.confirm_payment) still holds the order lock
+        transaction.on_commit(self.send_receipt_email)
 
+    def send_receipt_email(self):
         # Send order receipt email using reliable Zoho SMTP
         from accounts.zoho_email_utils import send_order_receipt_email
 
@@ -342,15 +364,13 @@ class Order(models.Model):
             self.items_snapshot = json.dumps(data)
 
     def get_items_snapshot(self):
-        """Return Python structure for snapshot (handles TextField fallback)."""
-        if JSONField is not None:
-            return self.items_snapshot or []
-        if not self.items_snapshot:
-            return []
-        try:
-            return json.loads(self.items_snapshot)
-        except Exception:
-            return []
+        """
+        Return the snapshot in the current format (see food/snapshots.py); older
+        double-encoded and legacy list snapshots are converted on read.
+        """
+        from .snapshots import read_snapshot
+
+        return read_snapshot(self.items_snapshot)
 
     def __str__(self):
         return f"Order {self.reference} ({self.status})"
@@ -414,8 +434,36 @@ class PaymentTransaction(models.Model):
         )
 
     paid_at = models.DateTimeField(blank=True, null=True)
+    # when the current Paystack initialization attempt started (created_at for
+    # the first one); see init_status
+    init_started_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    INIT_PENDING = "pending"
+    INIT_READY = "ready"
+    INIT_FAILED = "failed"
+
+    @property
+    def init_status(self):
+        # a failed initialization (food.payments) stores the response without a URL
+        if self.authorization_url:
+            return self.INIT_READY
+        if self.raw_response:
+            return self.INIT_FAILED
+        # an attempt that never finished (e.g. its worker restarted) counts as failed
+        if self.init_started_before(self.init_cutoff()):
+            return self.INIT_FAILED
+        return self.INIT_PENDING
+
+    @staticmethod
+    def init_cutoff():
+        """Attempts started before this have timed out (PAYSTACK_INIT_TIMEOUT)."""
+        return timezone.now() - timedelta(seconds=settings.PAYSTACK_INIT_TIMEOUT)
+
+    def init_started_before(self, when) -> bool:
+        started = self.init_started_at or self.created_at
+        return started is not None and started < when
+
     def mark_paid(self, when=None):
         if when is None:
             when = timezone.now()
@@ -424,3 +472,33 @@ class PaymentTransaction(models.Model):
 
     def __str__(self):
         return f"Payment for {self.order.reference} via {self.gateway}"
+
+
+class PaystackEvent(models.Model):
+    """
+    Inbox for Paystack webhook events. The webhook only verifies and stores the
+    event; `manage.py process_paystack_events` applies it (see food/paystack_webhook.py).
+    """
+
+    # "<event>:<data.id>" - Paystack retries deliveries, so duplicates collapse here
+    event_key = models.CharField(max_length=191, unique=True)
+    event = models.CharField(max_length=64)
+    reference = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # what processing did, e.g. food.payments.CONFIRM_PAID or "ignored"
+    outcome = models.CharField(max_length=32, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # the worker's queue: unprocessed events, oldest first
+            models.Index(
+                fields=["processed_at", "id"], name="paystack_event_queue_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.reference or self.event_key}"
@@ -1,5 +1,47 @@
+from django.db.models import OuterRef, Subquery
 from rest_framework import serializers
 from .models import Order, OrderItem, MealPlan
+from .snapshots import snapshot_summary
+
+
+def first_item_queryset():
+    return OrderItem.objects.select_related("meal_plan").prefetch_related(
+        "meal_plan__meals"
+    )
+
+
+def with_first_item_id(queryset):
+    """Annotate each order with the pk of its first OrderItem."""
+    return queryset.annotate(
+        first_item_id=Subquery(
+            OrderItem.objects.filter(order=OuterRef("pk"))
+            .order_by("pk")
+            .values("pk")[:1]
+        )
+    )
+
+
+def stored_summary(order):
+    """The package/meals/macros summary recorded at checkout, or None for older orders."""
+    if not hasattr(order, "_stored_summary"):
+        order._stored_summary = order.get_items_snapshot().get("s")
+    return order._stored_summary
+
+
+def prefetch_first_items(orders):
+    """
+    Attach each order's first item (with its meal plan and that plan's meals) as
+    `order.first_item`, for a page of orders annotated by with_first_item_id, in
+    two queries, so OrderSummarySerializer doesn't look it up per field per order.
+    Orders with a stored summary don't need it and are skipped.
+    """
+    orders = list(orders)
+    legacy = [o for o in orders if stored_summary(o) is None]
+    item_ids = [o.first_item_id for o in legacy if o.first_item_id is not None]
+    items = first_item_queryset().in_bulk(item_ids) if item_ids else {}
+    for order in legacy:
+        order.first_item = items.get(order.first_item_id)
+    return orders
 
 
 class GuestOrderLookupSerializer(serializers.Serializer):
@@ -46,41 +88,43 @@ class OrderSummarySerializer(serializers.ModelSerializer):
             "total",
         ]
 
+    def _first_item(self, obj):
+        # one lookup per order (prefetch_first_items does it for a whole page)
+        if not hasattr(obj, "first_item"):
+            obj.first_item = (
+                first_item_queryset().filter(order=obj).order_by("pk").first()
+            )
+        return obj.first_item
+
+    def _summary(self, obj):
+        """
+        The summary stored at checkout; older orders get the same one computed
+        from their first item's meal plan, so both read alike.
+        """
+        summary = stored_summary(obj)
+        if summary is None:
+            if not hasattr(obj, "_legacy_summary"):
+                item = self._first_item(obj)
+                obj._legacy_summary = snapshot_summary(item and item.meal_plan)
+            summary = obj._legacy_summary
+        return summary
+
     def get_package_type(self, obj):
-        # Example: Dense/Lean from first order item meal_plan
-        item = obj.items.first()
-        if item and item.meal_plan:
-            return item.meal_plan.get_density_display()
-        return None
+        # Example: Dense/Lean from the first plan
+        density = self._summary(obj)["density"]
+        return dict(MealPlan.DENSITY_CHOICES).get(density) if density else None
 
     def get_plan_duration(self, obj):
-        item = obj.items.first()
-        if item and item.meal_plan:
-            return f"{item.meal_plan.days} Days"
-        return None
+        days = self._summary(obj)["days"]
+        return f"{days} Days" if days is not None else None
 
     def get_total_meals(self, obj):
-        item = obj.items.first()
-        if item and item.meal_plan:
-            return f"{item.meal_plan.meal_count * item.meal_plan.days} meals"
-        return None
+        meals = self._summary(obj)["meals"]
+        return f"{meals} meals" if meals is not None else None
 
     def get_total_macros(self, obj):
-        # Example: sum macros from all meals in plan
-        item = obj.items.first()
-        if item and item.meal_plan:
-            meals = item.meal_plan.meals.all()
-            calories = sum(m.calories for m in meals)
-            protein = sum(m.protein for m in meals)
-            carbs = sum(m.carbohydrates for m in meals)
-            fat = sum(m.fat for m in meals)
-            return {
-                "calories": calories,
-                "protein": protein,
-                "carbohydrates": carbs,
-                "fat": fat,
-            }
-        return None
+        # Example: macros summed over the first plan's meals
+        return self._summary(obj)["macros"]
 
     def get_total_meals_fee(self, obj):
         return obj.subtotal
@@ -0,0 +1,92 @@
+"""
+Keyset ("seek") pagination for newest-first lists such as order history.
+
+Pages are cut on (created_at, id) instead of with OFFSET: the cursor carries the
+last row's position and the next page is `WHERE (created_at, id) < cursor ORDER
+BY created_at DESC, id DESC LIMIT n`, which an index on (…, created_at, id)
+answers without reading the skipped rows, so page 50 costs the same as page 1.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    raw = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError):
+        raise NotFound("Invalid cursor.")
+
+
+class CreatedAtKeysetPagination(BasePagination):
+    """
+    Newest-first pages over a queryset of rows with `created_at` and `id`.
+    Query params: `cursor` (from the previous page's `next`) and `page_size`.
+    """
+
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> List:
+        self.request = request
+        size = self.get_page_size(request)
+        queryset = queryset.order_by("-created_at", "-id")
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+
+        # one extra row tells us whether there is a next page
+        rows = list(queryset[: size + 1])
+        page = rows[:size]
+        self.next_cursor: Optional[str] = None
+        if len(rows) > size:
+            last = page[-1]
+            self.next_cursor = encode_cursor(last.created_at, last.pk)
+        return page
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,205 @@
+"""
+Paystack transaction initialization for checkout, and payment confirmation.
+
+With PAYSTACK_INIT_MODE = "sync" (the default) CheckoutView calls Paystack inline
+and answers with the authorization URL. With "deferred" the order is created and
+the call is handed to a small thread pool once the order transaction commits;
+checkout answers 202 straight away and the client polls
+payments/status/<reference>/ for the authorization URL. A slow gateway then ties
+up pool threads instead of the request workers that also serve the catalog.
+
+Calls go through the pooled "paystack" client in ayta.http_client.
+`manage.py fake_paystack` serves a local stand-in with configurable latency
+(point PAYSTACK_BASE_URL at it) for comparing the two modes.
+
+`confirm_payment` marks an order paid once Paystack reports a successful charge;
+the verify redirect (food/paystack_verify.py) and the webhook inbox
+(food/paystack_webhook.py) both go through it.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, Optional
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+
+from ayta.http_client import gateway
+
+from .cart_ops import CartMutation
+from .models import Cart, Order, PaymentTransaction
+from .snapshots import to_kobo
+
+logger = logging.getLogger(__name__)
+
+INIT_DEFERRED = "deferred"
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def init_is_deferred() -> bool:
+    return settings.PAYSTACK_INIT_MODE == INIT_DEFERRED
+
+
+def paystack_retry_after() -> float:
+    """Seconds until Paystack's open circuit lets a call through (0 when closed)."""
+    return gateway("paystack").breaker.retry_after()
+
+
+def build_init_payload(order: Order, callback_url: str) -> Dict[str, Any]:
+    return {
+        "email": order.customer_email,
+        "amount": to_kobo(order.total),
+        "reference": order.reference,
+        "callback_url": callback_url,
+        "metadata": {
+            "order_id": order.pk,
+            "user_id": order.user_id,
+            "is_guest": order.user_id is None,
+        },
+    }
+
+
+def initialize_payment(
+    payment: PaymentTransaction, payload: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Initialize the Paystack transaction and record the authorization URL on
+    `payment` when Paystack accepts it. Returns Paystack's response body;
+    network and HTTP errors propagate as requests.RequestException (an open
+    circuit as its CircuitOpenError subclass, without calling Paystack).
+    """
+    headers = {
+        "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
+        "Content-Type": "application/json",
+    }
+    resp = gateway("paystack").post(
+        "/transaction/initialize", json=payload, headers=headers
+    )
+    resp.raise_for_status()
+    data = resp.json()
+
+    if data.get("status") and data.get("data"):
+        payment.authorization_url = data["data"].get("authorization_url")
+        payment.gateway_reference = data["data"].get("reference")
+        payment.raw_response = data
+        payment.save(
+            update_fields=["authorization_url", "gateway_reference", "raw_response"]
+        )
+    return data
+
+
+def record_init_failure(payment: PaymentTransaction, data: Dict[str, Any]) -> None:
+    """Mark the init as failed so payments/status/<reference>/ can retry it."""
+    # a stored response without a URL is what marks the init as failed
+    logger.error("Paystack init failed for payment %s: %s", payment.pk, data)
+    payment.raw_response = data or {"status": False}
+    payment.save(update_fields=["raw_response"])
+
+
+def _initialize_in_background(payment_id: int, payload: Dict[str, Any]) -> None:
+    try:
+        payment = PaymentTransaction.objects.get(pk=payment_id)
+        try:
+            data = initialize_payment(payment, payload)
+        except requests.RequestException as exc:
+            data = {"status": False, "message": str(exc)}
+        if not payment.authorization_url:
+            record_init_failure(payment, data)
+    except Exception:
+        logger.exception("Paystack init crashed for payment %s", payment_id)
+    finally:
+        # pool threads don't go through the request cycle that closes connections
+        connection.close()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PAYSTACK_INIT_WORKERS,
+                thread_name_prefix="paystack-init",
+            )
+    return _executor
+
+
+def schedule_payment_init(payment: PaymentTransaction, payload: Dict[str, Any]) -> None:
+    """Initialize `payment` on the background pool once the current transaction commits."""
+    transaction.on_commit(
+        lambda: _get_executor().submit(_initialize_in_background, payment.pk, payload)
+    )
+
+
+CONFIRM_PAID = "paid"
+CONFIRM_ALREADY_PAID = "already_paid"
+CONFIRM_AMOUNT_MISMATCH = "amount_mismatch"
+CONFIRM_NOT_FOUND = "not_found"
+
+
+@dataclass
+class PaymentConfirmation:
+    outcome: str
+    expected_kobo: Optional[int] = None
+    paid_kobo: Optional[int] = None
+
+
+def confirm_payment(reference: str, verified: Dict[str, Any]) -> PaymentConfirmation:
+    """
+    Mark the order `reference` paid from Paystack's transaction data (`verified`,
+    as returned by transaction/verify or carried by a charge.success event).
+    Idempotent: the order row is locked, so concurrent confirmations of the same
+    payment (redirect and webhook) mark it paid once.
+    """
+    gateway_ref = verified.get("reference")
+    paid_amount_kobo = int(verified.get("amount", 0))
+
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(reference=reference).first()
+        if order is None:
+            return PaymentConfirmation(CONFIRM_NOT_FOUND)
+        # idempotent: if already paid, just return success
+        if order.status == Order.STATUS_PAID:
+            return PaymentConfirmation(CONFIRM_ALREADY_PAID)
+
+        expected_kobo = to_kobo(order.total)
+        if paid_amount_kobo != expected_kobo:
+            # amount mismatch -> do NOT mark paid; log for manual review
+            logger.error(
+                "Paystack amount mismatch for %s: expected %s, paid %s",
+                reference,
+                expected_kobo,
+                paid_amount_kobo,
+            )
+            return PaymentConfirmation(
+                CONFIRM_AMOUNT_MISMATCH, expected_kobo, paid_amount_kobo
+            )
+
+        # Create/update payment transaction record
+        pt, created = PaymentTransaction.objects.get_or_create(
+            order=order, defaults={"gateway": "paystack"}
+        )
+        pt.gateway_reference = gateway_ref
+        pt.raw_response = verified
+        pt.save()
+
+        # mark order as paid
+        pt.mark_paid(when=None)  # sets paid_at
+        order.mark_paid()
+
+        # clear the user's cart (and its stored totals)
+        if order.user:
+            try:
+                cart = Cart.objects.filter(user=order.user).first()
+                if cart:
+                    mutation = CartMutation(cart)
+                    mutation.clear()
+                    mutation.commit()
+            except Exception:
+                logger.exception("Could not clear cart after paying %s", reference)
+
+    return PaymentConfirmation(CONFIRM_PAID, expected_kobo, paid_amount_kobo)
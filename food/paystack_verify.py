@@ -1,28 +1,33 @@
 # food/paystack_verify.py
 import json
-from decimal import Decimal
 from typing import Optional, Dict, Any
 from django.conf import settings
 from django.shortcuts import redirect
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
 from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.db import transaction
 import requests
 
-from .models import Order, PaymentTransaction, Cart
+from ayta.http_client import gateway
 
-PAYSTACK_VERIFY_URL = "https://api.paystack.co/transaction/verify/{reference}"
+from .payments import (
+    CONFIRM_ALREADY_PAID,
+    CONFIRM_AMOUNT_MISMATCH,
+    CONFIRM_NOT_FOUND,
+    confirm_payment,
+)
+
+PAYSTACK_VERIFY_PATH = "/transaction/verify/{reference}"
 
 
 def _verify_transaction_with_paystack(reference: str) -> Optional[Dict[str, Any]]:
     """
     Calls Paystack verify endpoint. Returns the 'data' dict on success or None on failure.
     """
-    url = PAYSTACK_VERIFY_URL.format(reference=reference)
+    path = PAYSTACK_VERIFY_PATH.format(reference=reference)
     headers = {"Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}"}
     try:
-        resp = requests.get(url, headers=headers, timeout=15)
+        resp = gateway("paystack").get(path, headers=headers)
         resp.raise_for_status()
         body = resp.json()
     except requests.RequestException:
@@ -58,61 +63,24 @@ def paystack_verify_redirect(request):
         # You may optionally redirect to a frontend error page with query params
         return JsonResponse({"status": False, "message": "Unable to verify payment with gateway."}, status=502)
 
-    # find your order by the reference you sent when initializing Paystack
-    # Paystack returns `reference` and `amount` (amount is in kobo)
-    gateway_ref = verified.get("reference")
-    paid_amount_kobo = int(verified.get("amount", 0))
-
-    # Locate order and update atomically
-    try:
-        with transaction.atomic():
-            order = Order.objects.select_for_update().get(reference=reference)
-            # idempotent: if already paid, just return success
-            if order.status == Order.STATUS_PAID:
-                # Optionally return redirect to frontend success
-                return JsonResponse({"status": True, "message": "Order already paid.", "reference": reference})
-
-            # verify amount matches expected order.total (convert kobo -> naira)
-            try:
-                expected_kobo = int((order.total * Decimal("100")).quantize(Decimal("1")))
-            except Exception:
-                expected_kobo = None
-
-            if expected_kobo is not None and paid_amount_kobo != expected_kobo:
-                # amount mismatch -> do NOT mark paid; log/raise for manual review
-                return JsonResponse({
-                    "status": False,
-                    "message": "Payment amount mismatch.",
-                    "expected_kobo": expected_kobo,
-                    "paid_kobo": paid_amount_kobo,
-                }, status=400)
-
-            # Create/update payment transaction record
-            pt, created = PaymentTransaction.objects.get_or_create(order=order, defaults={"gateway": "paystack"})
-            pt.gateway_reference = gateway_ref
-            # store the raw response (JSONField or TextField handled in model)
-            pt.raw_response = verified
-            pt.paid_at = pt.paid_at or None  # we'll set below
-            pt.save()
-
-            # mark order as paid
-            pt.mark_paid(when=None)  # sets paid_at
-            order.mark_paid()
-
-            # optional: clear the user's cart
-            if order.user:
-                try:
-                    cart = Cart.objects.filter(user=order.user).first()
-                    if cart:
-                        cart.items.all().delete()
-                        cart.plans.all().delete()
-                except Exception:
-                    # swallow but consider logging
-                    pass
+    # find your order by the reference you sent when initializing Paystack and
+    # mark it paid (shared with the webhook inbox, see food/payments.py)
+    confirmation = confirm_payment(reference, verified)
 
-    except Order.DoesNotExist:
+    if confirmation.outcome == CONFIRM_NOT_FOUND:
         # Unknown reference -> return 404 or a friendly response
         return JsonResponse({"status": False, "message": "Order not found for this reference."}, status=404)
+    if confirmation.outcome == CONFIRM_ALREADY_PAID:
+        # Optionally return redirect to frontend success
+        return JsonResponse({"status": True, "message": "Order already paid.", "reference": reference})
+    if confirmation.outcome == CONFIRM_AMOUNT_MISMATCH:
+        # amount mismatch -> do NOT mark paid; log/raise for manual review
+        return JsonResponse({
+            "status": False,
+            "message": "Payment amount mismatch.",
+            "expected_kobo": confirmation.expected_kobo,
+            "paid_kobo": confirmation.paid_kobo,
+        }, status=400)
 
     # at this point payment verified and order marked paid.
     # return JSON or redirect to your frontend success page. Example redirect:
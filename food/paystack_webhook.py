@@ -0,0 +1,144 @@
+"""
+Paystack webhook ingestion.
+
+POST payments/webhook/ is Paystack's webhook URL. It checks the
+X-Paystack-Signature header (HMAC-SHA512 of the raw body keyed with
+PAYSTACK_SECRET_KEY), stores the event in the PaystackEvent inbox and answers 200
+straight away; nothing else happens on Paystack's request. Redeliveries of the
+same event collapse onto one row.
+
+`manage.py process_paystack_events` drains the inbox. A charge.success event marks
+its order paid through food.payments.confirm_payment, the same locked, idempotent
+path as the verify redirect, so payments whose browser redirect never arrives are
+still confirmed, and a redirect and a webhook racing for one order pay it once.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .models import PaystackEvent
+from .payments import confirm_payment
+
+logger = logging.getLogger(__name__)
+
+PAYSTACK_SIGNATURE_HEADER = "X-Paystack-Signature"
+CHARGE_SUCCESS = "charge.success"
+OUTCOME_IGNORED = "ignored"
+
+
+def valid_signature(body: bytes, signature: str) -> bool:
+    secret = settings.PAYSTACK_SECRET_KEY
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+@csrf_exempt
+@require_POST
+def paystack_webhook(request):
+    body = request.body
+    if not valid_signature(body, request.headers.get(PAYSTACK_SIGNATURE_HEADER, "")):
+        return JsonResponse(
+            {"status": False, "message": "Invalid signature."}, status=401
+        )
+    try:
+        payload = json.loads(body)
+        event = payload["event"]
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse(
+            {"status": False, "message": "Malformed event."}, status=400
+        )
+
+    data = payload.get("data") or {}
+    # Paystack retries until it gets a 2xx; the unique key drops redeliveries
+    event_id = data.get("id") or hashlib.sha256(body).hexdigest()
+    PaystackEvent.objects.bulk_create(
+        [
+            PaystackEvent(
+                event_key=f"{event}:{event_id}"[:191],
+                event=event[:64],
+                reference=str(data.get("reference") or "")[:64],
+                payload=payload,
+            )
+        ],
+        ignore_conflicts=True,
+    )
+    return JsonResponse({"status": True})
+
+
+def apply_event(event: PaystackEvent) -> str:
+    """Act on one inbox event and return the outcome to record."""
+    data = event.payload.get("data") or {}
+    if event.event != CHARGE_SUCCESS or data.get("status") != "success":
+        return OUTCOME_IGNORED
+    if not event.reference:
+        return OUTCOME_IGNORED
+    return confirm_payment(event.reference, data).outcome
+
+
+def process_event(event_id: int, max_attempts: int) -> Optional[PaystackEvent]:
+    """
+    Process one pending event. The row is locked (skipping rows another worker
+    holds) for the duration, so each event is applied by a single worker.
+    Returns the updated event (processed_at is set on success), or None when it
+    was taken or finished by someone else.
+    """
+    with transaction.atomic():
+        event = (
+            PaystackEvent.objects.select_for_update(skip_locked=True)
+            .filter(pk=event_id, processed_at__isnull=True, attempts__lt=max_attempts)
+            .first()
+        )
+        if event is None:
+            return None
+
+        event.attempts += 1
+        try:
+            with transaction.atomic():
+                event.outcome = apply_event(event)
+        except Exception as exc:
+            logger.exception("Paystack event %s failed", event.pk)
+            event.last_error = repr(exc)
+        else:
+            event.processed_at = timezone.now()
+            event.last_error = ""
+        event.save(update_fields=["attempts", "outcome", "last_error", "processed_at"])
+    return event
+
+
+def process_pending_events(
+    batch_size: int = 100, max_attempts: int = 5
+) -> Tuple[int, int]:
+    """
+    Process up to `batch_size` pending events, oldest first. Returns
+    (processed, failed); failed events are retried on later runs until they
+    have been attempted `max_attempts` times.
+    """
+    pending = list(
+        PaystackEvent.objects.filter(
+            processed_at__isnull=True, attempts__lt=max_attempts
+        )
+        .order_by("id")
+        .values_list("pk", flat=True)[:batch_size]
+    )
+    processed = failed = 0
+    for event_id in pending:
+        event = process_event(event_id, max_attempts)
+        if event is None:
+            continue
+        if event.processed_at:
+            processed += 1
+        else:
+            failed += 1
+    return processed, failed
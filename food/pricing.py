@@ -0,0 +1,262 @@
+"""
+Cart pricing engine.
+
+`price_cart` loads a cart's plans and items (with their meal plans and food items)
+in two queries and returns a `CartBreakdown` that checkout, the cart summary,
+the cart serializer and the admin all share instead of re-querying per plan.
+
+`load_cart` prefetches that same graph onto a Cart instance so serializers can
+render it without issuing further queries.
+
+The `*_totals` helpers express lines as contributions to the totals stored on
+Cart (TOTAL_FIELDS), which CartMutation keeps up to date incrementally.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Cart, CartItem, CartPlan, FoodItem
+
+MACRO_FIELDS = ("calories", "protein", "carbohydrates", "fat")
+# denormalized on Cart, see CartBreakdown.totals()
+TOTAL_FIELDS = ("subtotal", "item_count", "meal_count", *MACRO_FIELDS)
+TOTALS_PRECISION = Decimal("0.01")
+
+
+def _empty_macros() -> Dict[str, Decimal]:
+    return {name: Decimal(0) for name in MACRO_FIELDS}
+
+
+def _food_macros(food_item: FoodItem, quantity: int) -> Dict[str, Decimal]:
+    qty = Decimal(quantity)
+    return {
+        name: Decimal(str(getattr(food_item, name, 0) or 0)) * qty
+        for name in MACRO_FIELDS
+    }
+
+
+def _item_macros(item: CartItem, multiplier: int = 1) -> Dict[str, Decimal]:
+    return _food_macros(item.food_item, item.quantity * multiplier)
+
+
+def _add_macros(total: Dict[str, Decimal], other: Dict[str, Decimal]) -> None:
+    for name in MACRO_FIELDS:
+        total[name] += other[name]
+
+
+@dataclass
+class PlanLine:
+    """Priced CartPlan together with the CartItems that belong to it."""
+
+    cart_plan: CartPlan
+    items: List[CartItem]
+    # price of a single copy of the plan (snapshot price or sum of its meals)
+    unit_price: Decimal
+    total: Decimal
+    # macros of a single copy of the plan
+    unit_macros: Dict[str, Decimal]
+
+    @property
+    def quantity(self) -> int:
+        return self.cart_plan.quantity
+
+
+@dataclass
+class CartBreakdown:
+    cart: Cart
+    plans: List[PlanLine] = field(default_factory=list)
+    custom_items: List[CartItem] = field(default_factory=list)
+    plan_total: Decimal = Decimal("0.00")
+    custom_total: Decimal = Decimal("0.00")
+    macros: Dict[str, Decimal] = field(default_factory=_empty_macros)
+
+    @property
+    def total(self) -> Decimal:
+        return self.plan_total + self.custom_total
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.plans and not self.custom_items
+
+    def plan_line(self, cart_plan_id: int) -> Optional[PlanLine]:
+        for line in self.plans:
+            if line.cart_plan.pk == cart_plan_id:
+                return line
+        return None
+
+    def totals(self) -> Dict[str, Any]:
+        """The values Cart stores in TOTAL_FIELDS for this breakdown."""
+        totals = empty_totals()
+        for line in self.plans:
+            add_totals(totals, line_totals(line))
+        for item in self.custom_items:
+            add_totals(totals, food_totals(item.food_item, item.quantity))
+            totals["item_count"] += 1
+        return {name: quantize_total(value) for name, value in totals.items()}
+
+    def meal_totals(self) -> Tuple[int, Dict[str, Decimal]]:
+        """
+        Meals and macros the cart delivers, as the cart summary and order history
+        show them: each plan counts meal_count x days x quantity meals and its
+        meals' macros x days x quantity; custom items count once per unit.
+        """
+        meals = 0
+        macros = _empty_macros()
+        for line in self.plans:
+            mp = line.cart_plan.meal_plan
+            quantity = line.quantity or 1
+            meals += (mp.meal_count or 0) * (mp.days or 0) * quantity
+            # macros for one cycle (the plan's meals in the cart), scaled by days and quantity
+            scale = Decimal(mp.days or 0) * Decimal(quantity)
+            for name in MACRO_FIELDS:
+                macros[name] += line.unit_macros[name] * scale
+        for item in self.custom_items:
+            quantity = item.quantity or 1
+            meals += quantity
+            _add_macros(macros, _food_macros(item.food_item, quantity))
+        return meals, macros
+
+
+def quantize_total(value: Any) -> Any:
+    # stored decimal totals have two places
+    if isinstance(value, Decimal):
+        return value.quantize(TOTALS_PRECISION)
+    return value
+
+
+def empty_totals() -> Dict[str, Any]:
+    return {
+        "subtotal": Decimal(0),
+        "item_count": 0,
+        "meal_count": 0,
+        **_empty_macros(),
+    }
+
+
+def add_totals(
+    totals: Dict[str, Any], other: Dict[str, Any], multiplier: int = 1
+) -> None:
+    for name in TOTAL_FIELDS:
+        totals[name] += other[name] * multiplier
+
+
+def food_totals(food_item: FoodItem, quantity: int) -> Dict[str, Any]:
+    """Contribution of `quantity` (may be negative) of a custom food, excluding item_count."""
+    return {
+        **empty_totals(),
+        "subtotal": food_item.price * quantity,
+        "meal_count": quantity,
+        **_food_macros(food_item, quantity),
+    }
+
+
+def plan_copy_totals(line: PlanLine) -> Dict[str, Any]:
+    """Contribution of one more copy of an existing plan line (price and macros only)."""
+    return {**empty_totals(), "subtotal": line.unit_price, **line.unit_macros}
+
+
+def line_totals(line: PlanLine) -> Dict[str, Any]:
+    """Contribution of a whole plan line: its copies, its meals and one cart line."""
+    totals = empty_totals()
+    add_totals(totals, plan_copy_totals(line), line.quantity)
+    totals["item_count"] = 1
+    totals["meal_count"] = sum(item.quantity for item in line.items)
+    return totals
+
+
+def stored_totals(cart: Cart) -> Dict[str, Any]:
+    return {name: getattr(cart, name) for name in TOTAL_FIELDS}
+
+
+def load_cart(cart: Cart) -> Cart:
+    """
+    Prefetch the cart's plans (with meal plans) and all of its items (with food
+    items) in two queries. Plan items and custom items are split in Python by
+    `price_cart`, so the graph costs the same however many lines the cart has.
+    """
+    cache = getattr(cart, "_prefetched_objects_cache", {})
+    lookups = []
+    if "plans" not in cache:
+        lookups.append(
+            Prefetch("plans", queryset=CartPlan.objects.select_related("meal_plan"))
+        )
+    if "items" not in cache:
+        lookups.append(
+            Prefetch("items", queryset=CartItem.objects.select_related("food_item"))
+        )
+    if lookups and cart.pk is not None:
+        prefetch_related_objects([cart], *lookups)
+    return cart
+
+
+def _load_plans(cart: Cart) -> List[CartPlan]:
+    # reuse a prefetch done by the caller (e.g. admin changelist) when available
+    if "plans" in getattr(cart, "_prefetched_objects_cache", {}):
+        return list(cart.plans.all())
+    return list(cart.plans.select_related("meal_plan"))
+
+
+def _load_items(cart: Cart) -> List[CartItem]:
+    if "items" in getattr(cart, "_prefetched_objects_cache", {}):
+        return list(cart.items.all())
+    return list(cart.items.select_related("food_item"))
+
+
+def price_plan(cart_plan: CartPlan, items: List[CartItem]) -> PlanLine:
+    unit_macros = _empty_macros()
+    items_total = Decimal(0)
+    for item in items:
+        items_total += item.food_item.price * item.quantity
+        _add_macros(unit_macros, _item_macros(item))
+
+    unit_price = cart_plan.price if cart_plan.price is not None else items_total
+    return PlanLine(
+        cart_plan=cart_plan,
+        items=items,
+        unit_price=unit_price,
+        total=unit_price * cart_plan.quantity,
+        unit_macros=unit_macros,
+    )
+
+
+def price_cart(cart: Cart) -> CartBreakdown:
+    """Price `cart` from its plans and items in (at most) two queries."""
+    if cart.pk is None:
+        # unsaved carts: a cache-backed guest cart (food.guest_carts) brings its
+        # own lines, an empty stand-in (food.views.empty_cart) has none
+        guest_cart = getattr(cart, "guest_cart", None)
+        if guest_cart is None:
+            return CartBreakdown(cart=cart)
+        return price_lines(cart, *guest_cart.lines())
+    return price_lines(cart, _load_plans(cart), _load_items(cart))
+
+
+def price_lines(
+    cart: Cart, plans: Iterable[CartPlan], items: Iterable[CartItem]
+) -> CartBreakdown:
+    """
+    Price the given lines of `cart` (items already carry their food_item).
+    Used directly for a subset of a cart, e.g. the lines a mutation touched.
+    """
+    items_by_plan: Dict[Optional[int], List[CartItem]] = defaultdict(list)
+    for item in items:
+        items_by_plan[item.cart_plan_id].append(item)
+
+    breakdown = CartBreakdown(cart=cart, custom_items=items_by_plan.pop(None, []))
+
+    for cart_plan in plans:
+        line = price_plan(cart_plan, items_by_plan.get(cart_plan.pk, []))
+        breakdown.plans.append(line)
+        breakdown.plan_total += line.total
+        for name in MACRO_FIELDS:
+            breakdown.macros[name] += line.unit_macros[name] * cart_plan.quantity
+
+    for item in breakdown.custom_items:
+        breakdown.custom_total += item.food_item.price * item.quantity
+        _add_macros(breakdown.macros, _item_macros(item))
+
+    return breakdown
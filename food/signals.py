@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog_cache import bump_catalog_version
+from .models import FoodItem, MealPlan
+
+
+@receiver(post_save, sender=FoodItem)
+@receiver(post_delete, sender=FoodItem)
+@receiver(post_save, sender=MealPlan)
+@receiver(post_delete, sender=MealPlan)
+def invalidate_catalog_on_change(sender, **kwargs):
+    # after commit: a read between the bump and the commit would cache the old
+    # rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(m2m_changed, sender=MealPlan.meals.through)
+def invalidate_catalog_on_meals_change(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,124 @@
+"""
+Order items snapshot format.
+
+Orders keep what was bought, at the prices charged, in Order.items_snapshot. The
+current format (version 2) is stored natively in the JSON column:
+
+    {"v": 2, "lines": [
+        {"t": "p", "id": <meal_plan_id>, "n": "<title>", "q": 2, "u": 150000, "x": 300000},
+        {"t": "c", "id": <food_item_id>, "n": "<name>", "q": 1, "u": 1500, "x": 1500},
+    ],
+     "s": {"density": "lean", "days": 7, "meals": 21,
+           "macros": {"calories": 1350, "protein": 90.0, ...}}}
+
+"t" is the line type (LINE_PLAN / LINE_CUSTOM), "q" the quantity and "u" / "x" the
+unit price and line total in kobo, so amounts are exact integers in the same unit
+Paystack charges in. "s" is the order history summary, fixed at checkout so later
+menu changes don't alter it: the first plan's density and days, its meal_count x
+days meals and the summed macros of its meals (see `snapshot_summary`). Orders
+placed before it was recorded have no "s"; order history computes the same
+summary for them from their first item's meal plan.
+
+Orders created before version 2 hold a list of verbose line dicts with decimal
+strings, serialized to a JSON string inside the JSON column (migration 0014
+rewrites those). `read_snapshot` accepts any of these and returns version 2.
+"""
+
+import json
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+SNAPSHOT_VERSION = 2
+
+LINE_PLAN = "p"
+LINE_CUSTOM = "c"
+
+_LEGACY_TYPES = {"meal_plan": LINE_PLAN, "custom_item": LINE_CUSTOM}
+
+
+def to_kobo(amount: Any) -> int:
+    """Naira amount (Decimal, number or decimal string) as integer kobo."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1")))
+
+
+def from_kobo(kobo: int) -> Decimal:
+    return (Decimal(kobo) / 100).quantize(Decimal("0.01"))
+
+
+def snapshot_line(
+    line_type: str, object_id: int, name: str, quantity: int, unit_price, total
+) -> Dict[str, Any]:
+    return {
+        "t": line_type,
+        "id": object_id,
+        "n": name,
+        "q": quantity,
+        "u": to_kobo(unit_price),
+        "x": to_kobo(total),
+    }
+
+
+def make_snapshot(
+    lines: List[Dict[str, Any]], summary: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    snapshot = {"v": SNAPSHOT_VERSION, "lines": lines}
+    if summary is not None:
+        snapshot["s"] = summary
+    return snapshot
+
+
+def snapshot_summary(meal_plan) -> Dict[str, Any]:
+    """
+    The order history summary for an order whose first line is `meal_plan` (None
+    for custom-only orders): meals count meal_count x days, macros are the sums
+    of the plan's meals (int calories, float grams), as history always showed.
+    """
+    if meal_plan is None:
+        return {"density": None, "days": None, "meals": None, "macros": None}
+    meals = meal_plan.meals.all()
+    return {
+        "density": meal_plan.density,
+        "days": meal_plan.days,
+        "meals": meal_plan.meal_count * meal_plan.days,
+        "macros": {
+            "calories": sum(m.calories for m in meals),
+            "protein": sum(m.protein for m in meals),
+            "carbohydrates": sum(m.carbohydrates for m in meals),
+            "fat": sum(m.fat for m in meals),
+        },
+    }
+
+
+def _from_legacy_line(line: Dict[str, Any]) -> Dict[str, Any]:
+    line_type = _LEGACY_TYPES.get(line.get("type"), LINE_CUSTOM)
+    if line_type == LINE_PLAN:
+        object_id, name = line.get("meal_plan_id"), line.get("title")
+    else:
+        object_id, name = line.get("food_item_id"), line.get("name")
+    return snapshot_line(
+        line_type,
+        object_id,
+        name or "",
+        line.get("quantity") or 0,
+        line.get("unit_price") or 0,
+        line.get("line_total") or 0,
+    )
+
+
+def read_snapshot(raw: Any) -> Dict[str, Any]:
+    """
+    Version 2 snapshot for whatever an Order holds: a version 2 dict, a legacy
+    list of lines, either of those double-encoded as a JSON string, or nothing.
+    """
+    if isinstance(raw, (str, bytes)):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raw = None
+    if isinstance(raw, dict) and raw.get("v") == SNAPSHOT_VERSION:
+        return raw
+    if isinstance(raw, list):
+        return make_snapshot(
+            [_from_legacy_line(line) for line in raw if isinstance(line, dict)]
+        )
+    return make_snapshot([])
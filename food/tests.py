@@ -1,3 +1,1547 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import importlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import PasswordResetOTP
+from ayta.http_client import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitOpenError,
+    gateway,
+    gateway_stats,
+    reset_gateways,
+)
+
+from .cart_ops import ensure_cart
+from .guest_carts import GuestCart
+from .pricing import price_cart, stored_totals
+from .catalog_cache import catalog_cache_key, get_catalog_version
+from .cart_serializers import CartSerializer
+from .models import (
+    Cart,
+    CartItem,
+    CartPlan,
+    FoodItem,
+    MealPlan,
+    Order,
+    PaymentTransaction,
+    PaystackEvent,
+)
+from .order_serializers import OrderSummarySerializer, with_first_item_id
+from .paystack_webhook import process_pending_events
+from .snapshots import read_snapshot
+from .views import get_cart, get_or_create_cart
+
+
+def make_food_items(count, price="1500.00", food_type="lean"):
+    return [
+        FoodItem.objects.create(
+            name=f"Meal {i}",
+            price=Decimal(price),
+            description="",
+            ingredients="",
+            calories=400,
+            protein=30,
+            carbohydrates=40,
+            fat=10,
+            food_type=food_type,
+            category="lunch_dinner",
+        )
+        for i in range(count)
+    ]
+
+
+class OrderSnapshotMigrationTests(TestCase):
+    legacy_lines = [
+        {
+            "type": "meal_plan",
+            "meal_plan_id": 3,
+            "title": "21 meals",
+            "quantity": 2,
+            "unit_price": "31500.00",
+            "line_total": "63000.00",
+        },
+        {
+            "type": "custom_item",
+            "food_item_id": 7,
+            "name": "Jollof",
+            "quantity": 1,
+            "unit_price": "1500.5",
+            "line_total": "1500.5",
+        },
+        "not a line",
+    ]
+
+    def test_migration_converts_like_read_snapshot(self):
+        migration = importlib.import_module("food.migrations.0014_order_snapshot_v2")
+        v2 = read_snapshot(self.legacy_lines)
+        for raw in (
+            self.legacy_lines,
+            json.dumps(self.legacy_lines),
+            json.dumps(v2),
+            v2,
+            "not json",
+            None,
+        ):
+            self.assertEqual(migration.read_snapshot(raw), read_snapshot(raw))
+
+        self.assertEqual(v2["lines"][0]["u"], 3150000)
+        self.assertEqual(v2["lines"][1]["t"], "c")
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.food = make_food_items(1)[0]
+
+    def test_list_is_served_from_cache(self):
+        self.client.get(reverse("meal-list"))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("meal-list"))
+
+        self.assertEqual(response.json()[0]["name"], "Meal 0")
+
+    def test_edit_invalidates_once_committed(self):
+        self.client.get(reverse("meal-list"))
+        version = get_catalog_version()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.food.name = "Renamed"
+            self.food.save()
+        # nothing is invalidated while the edit is uncommitted
+        self.assertEqual(get_catalog_version(), version)
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(
+            self.client.get(reverse("meal-list")).json()[0]["name"], "Renamed"
+        )
+
+    def test_cache_key_is_valid_for_any_filter_value(self):
+        key = catalog_cache_key("meals", {"type": "a b\n" + "x" * 500})
+
+        self.assertLess(len(key), 100)
+        self.assertNotRegex(key, r"\s")
+
+    def test_unknown_filter_values_are_not_cached(self):
+        url = reverse("meals-by-type-category")
+        with mock.patch(
+            "food.catalog_cache.get_or_build", return_value=[]
+        ) as get_or_build:
+            self.client.get(url, {"type": "not-a-type"})
+            get_or_build.assert_not_called()
+
+            self.client.get(url, {"type": "lean", "category": "breakfast"})
+            get_or_build.assert_called_once()
+
+
+class CartSerializerQueryCountTests(TestCase):
+    def add_plan(self, cart, meal_count, days=7):
+        plan = MealPlan.objects.create(meal_count=meal_count, days=days, density="lean")
+        meals = make_food_items(meal_count)
+        plan.meals.set(meals)
+        cart_plan = CartPlan.objects.create(cart=cart, meal_plan=plan)
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, food_item=meal, cart_plan=cart_plan) for meal in meals
+        )
+        return cart_plan
+
+    def add_custom_items(self, cart, count):
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, food_item=meal, quantity=2)
+            for meal in make_food_items(count)
+        )
+
+    def test_small_cart_renders_in_two_queries(self):
+        cart = Cart.objects.create(session_key="small")
+        self.add_plan(cart, meal_count=1, days=1)
+
+        cart = Cart.objects.get(pk=cart.pk)
+        with self.assertNumQueries(2):
+            data = CartSerializer(cart).data
+
+        self.assertEqual(len(data["plans"][0]["items"]), 1)
+        self.assertEqual(data["total_price"], "1500.00")
+
+    def test_large_cart_renders_in_same_number_of_queries(self):
+        cart = Cart.objects.create(session_key="large")
+        self.add_plan(cart, meal_count=21)
+        self.add_plan(cart, meal_count=15, days=5)
+        self.add_custom_items(cart, 10)
+
+        cart = Cart.objects.get(pk=cart.pk)
+        with self.assertNumQueries(2):
+            data = CartSerializer(cart).data
+
+        self.assertEqual([len(p["items"]) for p in data["plans"]], [21, 15])
+        self.assertEqual(len(data["custom_items"]), 10)
+        self.assertEqual(data["plans"][0]["computed_price"], Decimal("31500.00"))
+        # 36 plan meals + 10 custom items x 2
+        self.assertEqual(data["total_price"], str(Decimal("1500.00") * 56))
+
+
+class CartApiTestMixin:
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.meals = make_food_items(3)
+        self.plan = MealPlan.objects.create(meal_count=3, days=7, density="lean")
+        self.plan.meals.set(self.meals)
+
+    def post(self, name, data, **extra):
+        return self.client.post(reverse(name), data, format="json", **extra)
+
+    def add_plan(self, plan=None, **data):
+        return self.post(
+            "add-plan-to-cart", {"plan_id": (plan or self.plan).pk, **data}
+        )
+
+    def add_custom(self, quantities, **extra):
+        return self.post(
+            "add-custom-selection",
+            {"meal_ids": list(quantities), "quantities": quantities},
+            **extra,
+        )
+
+    def cart(self):
+        return Cart.objects.get()
+
+    def custom_quantities(self):
+        return dict(
+            self.cart()
+            .items.filter(cart_plan__isnull=True)
+            .values_list("food_item_id", "quantity")
+        )
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return len(queries)
+
+
+class AddPlanToCartTests(CartApiTestMixin, APITestCase):
+    def test_plan_items_are_added_for_each_meal(self):
+        response = self.add_plan(quantity=2)
+
+        self.assertEqual(response.status_code, 200)
+        cart_plan = self.cart().plans.get()
+        self.assertEqual(cart_plan.quantity, 2)
+        self.assertEqual(
+            sorted(cart_plan.items.values_list("food_item_id", "quantity")),
+            [(meal.pk, 1) for meal in self.meals],
+        )
+
+    def test_merge_adds_to_the_existing_plan(self):
+        self.add_plan()
+        self.add_plan(merge=True)
+        self.assertEqual(self.cart().plans.get().quantity, 2)
+        self.assertEqual(self.cart().items.count(), 3)
+
+        self.add_plan()
+        self.assertEqual(self.cart().plans.count(), 2)
+
+    def test_insert_cost_does_not_grow_with_plan_size(self):
+        big_plan = MealPlan.objects.create(meal_count=7, days=7, density="lean")
+        big_plan.meals.set(make_food_items(7))
+        self.add_plan()
+
+        small = self.count_queries(lambda: self.add_plan())
+        big = self.count_queries(lambda: self.add_plan(big_plan))
+
+        self.assertEqual(small, big)
+        self.assertEqual(self.cart().items.count(), 3 + 3 + 7)
+
+    def test_plan_without_meals_is_rejected(self):
+        empty_plan = MealPlan.objects.create(meal_count=3, days=1, density="dense")
+
+        response = self.add_plan(empty_plan)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Cart.objects.exists())
+
+
+class AddCustomSelectionTests(CartApiTestMixin, APITestCase):
+    def test_repeated_ids_add_up(self):
+        a, b, c = self.meals
+        response = self.post(
+            "add-custom-selection",
+            {"meal_ids": [a.pk, a.pk, b.pk, c.pk], "quantities": {str(c.pk): 0}},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.custom_quantities(), {a.pk: 2, b.pk: 1})
+
+    def test_existing_lines_are_incremented(self):
+        a, b, _ = self.meals
+        self.add_custom({a.pk: 2})
+        self.add_custom({a.pk: 3, b.pk: 1})
+
+        self.assertEqual(self.custom_quantities(), {a.pk: 5, b.pk: 1})
+
+    def test_unknown_meal_adds_nothing(self):
+        response = self.add_custom({self.meals[0].pk: 1, 999999: 1})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_cost_does_not_grow_with_selection_size(self):
+        foods = make_food_items(8)
+        self.add_custom({self.meals[0].pk: 1})
+
+        small = self.count_queries(
+            lambda: self.add_custom({f.pk: 1 for f in foods[:2]})
+        )
+        big = self.count_queries(lambda: self.add_custom({f.pk: 1 for f in foods[2:]}))
+        existing = self.count_queries(lambda: self.add_custom({f.pk: 1 for f in foods}))
+
+        self.assertEqual(small, big)
+        # one UPDATE for all existing lines instead of the INSERT
+        self.assertEqual(existing, big)
+        self.assertEqual(set(self.custom_quantities().values()), {1, 2})
+
+
+class MergeGuestCartTests(CartApiTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(
+            username="merger", email="m@x.co", phone_number="08000000002"
+        )
+
+    def login(self):
+        self.client.force_authenticate(self.user)
+
+    def merge(self, session_key):
+        return self.post("merge-guest-cart", {"session_key": session_key})
+
+    def test_guest_lines_fold_into_the_user_cart(self):
+        a, b, _ = self.meals
+        self.add_plan()
+        self.add_custom({a.pk: 2, b.pk: 1})
+        session_key = self.client.session.session_key
+        self.login()
+        self.add_plan()
+        self.add_custom({a.pk: 1})
+
+        response = self.merge(session_key)
+
+        self.assertEqual(response.status_code, 200)
+        cart = self.cart()
+        self.assertEqual(cart.user, self.user)
+        self.assertEqual(cart.plans.get().quantity, 2)
+        self.assertEqual(cart.items.filter(cart_plan__isnull=False).count(), 3)
+        self.assertEqual(self.custom_quantities(), {a.pk: 3, b.pk: 1})
+        self.assertEqual(stored_totals(cart), price_cart(cart).totals())
+
+    def test_guest_only_lines_move_over(self):
+        self.add_custom({self.meals[0].pk: 2})
+        session_key = self.client.session.session_key
+        self.login()
+
+        self.merge(session_key)
+
+        self.assertEqual(self.cart().user, self.user)
+        self.assertEqual(self.custom_quantities(), {self.meals[0].pk: 2})
+
+    def test_unknown_session_leaves_the_user_cart(self):
+        self.login()
+        self.add_custom({self.meals[0].pk: 1})
+
+        response = self.merge("no-such-session")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.custom_quantities(), {self.meals[0].pk: 1})
+
+
+class UpdateCustomCartItemTests(CartApiTestMixin, APITestCase):
+    def change(self, change, food=None):
+        food = food or self.meals[0]
+        return self.post(
+            "update-custom-cart-item", {"food_item": food.pk, "change": change}
+        )
+
+    def test_changes_add_up_and_zero_removes_the_line(self):
+        food = self.meals[0]
+        self.assertEqual(self.change(1).status_code, 200)
+        self.change(2)
+        self.assertEqual(self.custom_quantities(), {food.pk: 3})
+
+        self.change(-1)
+        self.assertEqual(self.custom_quantities(), {food.pk: 2})
+
+        self.change(-5)
+        self.assertEqual(self.custom_quantities(), {})
+        cart = self.cart()
+        self.assertEqual(stored_totals(cart), price_cart(cart).totals())
+
+    def test_decrementing_a_missing_item_is_rejected(self):
+        self.change(1, self.meals[1])
+
+        response = self.change(-1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.custom_quantities(), {self.meals[1].pk: 1})
+
+    def test_decrement_that_keeps_losing_the_race_is_a_conflict(self):
+        self.change(1)
+
+        # every conditional delete finds the line already changed
+        with mock.patch("django.db.models.query.QuerySet.delete", return_value=(0, {})):
+            response = self.change(-1)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.custom_quantities(), {self.meals[0].pk: 1})
+
+
+class BatchCartTests(CartApiTestMixin, APITestCase):
+    def batch(self, *operations, **extra):
+        return self.post("cart-batch", {"operations": list(operations)}, **extra)
+
+    def test_operations_apply_in_order(self):
+        a, b, _ = self.meals
+        response = self.batch(
+            {"op": "add_plan", "plan_id": self.plan.pk, "quantity": 2},
+            {"op": "set_item", "food_item": a.pk, "quantity": 2},
+            {"op": "set_item", "food_item": b.pk, "quantity": 1},
+            {"op": "remove_item", "food_item": b.pk},
+            {"op": "set_item", "food_item": a.pk, "quantity": 3},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart().plans.get().quantity, 2)
+        self.assertEqual(self.custom_quantities(), {a.pk: 3})
+        self.assertEqual(len(response.json()["custom_items"]), 1)
+        self.assertEqual(self.cart().version, 1)
+
+    def test_failing_operation_rolls_back_the_batch(self):
+        self.add_custom({self.meals[1].pk: 1})
+
+        response = self.batch(
+            {"op": "set_item", "food_item": self.meals[0].pk, "quantity": 2},
+            {"op": "remove_item", "food_item": self.meals[1].pk},
+            {"op": "remove_plan", "cart_plan_id": 999999},
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["index"], 2)
+        self.assertEqual(self.custom_quantities(), {self.meals[1].pk: 1})
+        self.assertEqual(self.cart().version, 1)
+
+    def test_unknown_references_are_rejected_before_any_write(self):
+        response = self.batch(
+            {"op": "add_plan", "plan_id": self.plan.pk},
+            {"op": "set_item", "food_item": 999999, "quantity": 1},
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["index"], 1)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_unknown_operation_is_a_validation_error(self):
+        response = self.batch({"op": "explode"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class CartDeltaResponseTests(CartApiTestMixin, APITestCase):
+    delta = {"HTTP_X_CART_RESPONSE": "delta"}
+
+    def test_delta_has_only_the_touched_lines_and_new_totals(self):
+        a, b, _ = self.meals
+        self.add_plan()
+        self.add_custom({a.pk: 1})
+
+        body = self.add_custom({b.pk: 2}, **self.delta).json()
+
+        cart = self.cart()
+        self.assertEqual(body["version"], cart.version)
+        self.assertEqual(body["plans"], [])
+        self.assertEqual([i["food_item"] for i in body["custom_items"]], [b.pk])
+        self.assertEqual(body["removed_plans"], [])
+        self.assertEqual(body["removed_custom_items"], [])
+        self.assertEqual(Decimal(body["total_price"]), cart.subtotal)
+        self.assertEqual(body["total_meals"], cart.meal_count)
+
+    def test_query_param_opts_in_too(self):
+        response = self.client.post(
+            reverse("add-plan-to-cart") + "?response=delta",
+            {"plan_id": self.plan.pk},
+            format="json",
+        )
+
+        body = response.json()
+        self.assertEqual(len(body["plans"]), 1)
+        self.assertEqual(len(body["plans"][0]["items"]), 3)
+        self.assertNotIn("user", body)
+
+    def test_removals_are_listed_by_id(self):
+        food = self.meals[0]
+        self.add_plan()
+        self.add_custom({food.pk: 1})
+        cart_plan_id = self.cart().plans.get().pk
+
+        removed_item = self.post(
+            "remove-from-cart", {"food_item": food.pk}, **self.delta
+        ).json()
+        removed_plan = self.post(
+            "remove-from-cart", {"cart_plan_id": cart_plan_id}, **self.delta
+        ).json()
+
+        self.assertEqual(removed_item["removed_custom_items"], [food.pk])
+        self.assertEqual(removed_plan["removed_plans"], [cart_plan_id])
+        self.assertEqual(removed_plan["total_price"], "0.00")
+
+    def test_full_cart_without_opting_in(self):
+        body = self.add_plan().json()
+
+        self.assertIn("user", body)
+        self.assertNotIn("removed_plans", body)
+
+
+class StoredCartTotalsTests(CartApiTestMixin, APITestCase):
+    def assertTotalsMatchLines(self):
+        cart = self.cart()
+        self.assertEqual(stored_totals(cart), price_cart(cart).totals())
+
+    def test_every_mutation_keeps_the_stored_totals_exact(self):
+        a, b, c = self.meals
+        plan_id = self.add_plan(quantity=2).json()["plans"][0]["id"]
+        self.assertTotalsMatchLines()
+        self.add_plan(merge=True)
+        self.assertTotalsMatchLines()
+        self.add_custom({a.pk: 2, b.pk: 1})
+        self.assertTotalsMatchLines()
+        self.post("update-custom-cart-item", {"food_item": a.pk, "change": -1})
+        self.assertTotalsMatchLines()
+        self.post(
+            "cart-batch",
+            {
+                "operations": [
+                    {"op": "set_item", "food_item": c.pk, "quantity": 4},
+                    {"op": "remove_item", "food_item": b.pk},
+                ]
+            },
+        )
+        self.assertTotalsMatchLines()
+        self.post("remove-from-cart", {"cart_plan_id": plan_id})
+        self.assertTotalsMatchLines()
+
+        cart = self.cart()
+        self.assertEqual(cart.meal_count, 5)
+        self.assertEqual(cart.subtotal, Decimal("7500.00"))
+
+    def test_total_meals_reads_the_stored_count(self):
+        self.add_custom({self.meals[0].pk: 3})
+
+        with self.assertNumQueries(1):  # the cart row, no line queries
+            response = self.client.get(reverse("total-cart-meals"))
+
+        self.assertEqual(response.json(), {"total_meals": 3})
+
+    def test_recalculate_command_fixes_drift(self):
+        self.add_plan()
+        FoodItem.objects.filter(pk=self.meals[0].pk).update(price=Decimal("2000.00"))
+        Cart.objects.update(version=5)
+
+        call_command("recalculate_cart_totals", "--dry-run", stdout=StringIO())
+        self.assertNotEqual(
+            stored_totals(self.cart()), price_cart(self.cart()).totals()
+        )
+        call_command("recalculate_cart_totals", stdout=StringIO())
+
+        self.assertTotalsMatchLines()
+        self.assertEqual(self.cart().subtotal, Decimal("5000.00"))
+        self.assertEqual(self.cart().version, 5)
+
+
+class CartTotalsBackfillTests(CartApiTestMixin, APITestCase):
+    def test_migration_prices_carts_like_price_cart(self):
+        migration = importlib.import_module("food.migrations.0012_cart_totals")
+        CartPlan.objects.create(
+            cart=ensure_cart(session_key="priced"),
+            meal_plan=self.plan,
+            quantity=2,
+            price=Decimal("9999.99"),
+        )
+        self.add_plan(quantity=3)
+        self.add_custom({self.meals[0].pk: 2, self.meals[1].pk: 1})
+
+        for cart in Cart.objects.all():
+            items = cart.items.select_related("food_item")
+            self.assertEqual(
+                migration.cart_totals(cart.plans.all(), items),
+                price_cart(cart).totals(),
+            )
+
+
+class CartResolutionTests(CartApiTestMixin, APITestCase):
+    def guest_request(self, session_key=None):
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        request.session = SessionStore(session_key)
+        return request
+
+    def test_reading_creates_no_cart_or_session(self):
+        for name in ("cart-view", "total-cart-meals", "cart-summary"):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_cart_is_resolved_once_per_request(self):
+        session = SessionStore()
+        session.create()
+        cart = ensure_cart(session_key=session.session_key)
+        request = self.guest_request(session.session_key)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_cart(request), cart)
+            self.assertEqual(get_cart(request), cart)
+            self.assertEqual(get_or_create_cart(request), cart)
+
+    def test_visitor_without_cart_costs_no_queries(self):
+        request = self.guest_request()
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_cart(request))
+            self.assertIsNone(get_cart(request))
+
+    def test_first_mutation_creates_the_cart_later_reads_find(self):
+        self.add_custom({self.meals[0].pk: 2})
+
+        response = self.client.get(reverse("total-cart-meals"))
+
+        self.assertEqual(response.json(), {"total_meals": 2})
+        self.assertEqual(Cart.objects.count(), 1)
+
+
+@override_settings(GUEST_CART_STORE="cache")
+class CacheGuestCartTests(CartApiTestMixin, APITestCase):
+    def guest_state(self):
+        return GuestCart.load(self.client.session.session_key).state
+
+    def test_guest_cart_lives_in_the_cache(self):
+        a, b, _ = self.meals
+        self.add_plan(quantity=2)
+        self.add_custom({a.pk: 2, b.pk: 1})
+        self.post("update-custom-cart-item", {"food_item": b.pk, "change": -1})
+
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+        body = self.client.get(reverse("cart-view")).json()
+        self.assertEqual(body["plans"][0]["quantity"], 2)
+        self.assertEqual(
+            [(i["food_item"], i["quantity"]) for i in body["custom_items"]],
+            [(a.pk, 2)],
+        )
+        # 3 meals x 2 copies + 2 custom, at 1500 each
+        self.assertEqual(body["total_price"], "12000.00")
+        self.assertEqual(self.guest_state()["totals"]["meal_count"], 5)
+
+    def test_checkout_writes_the_cart_and_clears_the_cache(self):
+        self.add_plan()
+        self.add_custom({self.meals[0].pk: 2})
+
+        with mock.patch(
+            "food.views.initialize_payment", side_effect=paystack_accepts
+        ), self.captureOnCommitCallbacks(execute=True):
+            response = self.post("cart-checkout", CheckoutTestMixin.checkout_body)
+
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get()
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.total, Decimal("7500.00"))
+        self.assertIsNone(GuestCart.load(self.client.session.session_key))
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_failed_checkout_keeps_the_cached_cart(self):
+        self.add_custom({self.meals[0].pk: 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post("cart-checkout", {"full_name": "No Email"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.guest_state()["items"]), 1)
+
+    def test_login_merges_the_cached_cart(self):
+        a = self.meals[0]
+        self.add_plan()
+        self.add_custom({a.pk: 2})
+        session_key = self.client.session.session_key
+        user = get_user_model().objects.create(
+            username="cached", email="c@x.co", phone_number="08000000003"
+        )
+        self.client.force_authenticate(user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post("merge-guest-cart", {"session_key": session_key})
+
+        self.assertEqual(response.status_code, 200)
+        cart = Cart.objects.get(user=user)
+        self.assertEqual(cart.plans.count(), 1)
+        self.assertEqual(self.custom_quantities(), {a.pk: 2})
+        self.assertEqual(stored_totals(cart), price_cart(cart).totals())
+        self.assertIsNone(GuestCart.load(session_key))
+
+
+class PurgeStaleDataTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        old = now - timedelta(days=31)
+        food = make_food_items(1)[0]
+        self.user = get_user_model().objects.create(username="keep", email="k@x.co")
+
+        for i in range(3):
+            cart = Cart.objects.create(session_key=f"stale-{i}")
+            CartItem.objects.create(cart=cart, food_item=food, quantity=1)
+        self.fresh_cart = Cart.objects.create(session_key="fresh")
+        self.user_cart = Cart.objects.create(user=self.user)
+        Cart.objects.exclude(pk=self.fresh_cart.pk).update(updated_at=old)
+
+        Session.objects.create(
+            session_key="expired", session_data="", expire_date=now - timedelta(days=1)
+        )
+        Session.objects.create(
+            session_key="live", session_data="", expire_date=now + timedelta(days=1)
+        )
+
+        self.fresh_otp = PasswordResetOTP.objects.create(
+            user=self.user, otp_code="111111", expires_at=now + timedelta(minutes=10)
+        )
+        PasswordResetOTP.objects.create(
+            user=self.user, otp_code="222222", expires_at=now - timedelta(days=2)
+        )
+        used = PasswordResetOTP.objects.create(
+            user=self.user,
+            otp_code="333333",
+            expires_at=now + timedelta(minutes=10),
+            used=True,
+        )
+        PasswordResetOTP.objects.filter(pk=used.pk).update(created_at=old)
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command(
+            "purge_stale_data", "--batch-size", "2", "--pause", "0", *args, stdout=out
+        )
+        return out.getvalue()
+
+    def test_only_stale_rows_are_deleted_in_batches(self):
+        output = self.purge()
+
+        self.assertEqual(
+            set(Cart.objects.values_list("pk", flat=True)),
+            {self.fresh_cart.pk, self.user_cart.pk},
+        )
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(list(Session.objects.values_list("pk", flat=True)), ["live"])
+        self.assertEqual(list(PasswordResetOTP.objects.all()), [self.fresh_otp])
+        self.assertIn("guest carts: batch 2 - 1 rows", output)
+        self.assertIn("guest carts: 3 deleted", output)
+        self.assertIn("password reset OTPs: 2 deleted", output)
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.purge("--dry-run")
+
+        self.assertEqual(Cart.objects.count(), 5)
+        self.assertEqual(Session.objects.count(), 2)
+        self.assertEqual(PasswordResetOTP.objects.count(), 3)
+        self.assertIn("guest carts: 3 would be deleted", output)
+
+
+class CartVersionTests(CartApiTestMixin, APITestCase):
+    def if_match(self, version):
+        return {"HTTP_IF_MATCH": f'"{version}"'}
+
+    def test_etag_follows_the_cart_version(self):
+        self.assertEqual(self.client.get(reverse("cart-view"))["ETag"], '"0"')
+
+        response = self.add_plan()
+
+        self.assertEqual(response["ETag"], '"1"')
+        self.assertEqual(self.client.get(reverse("cart-view"))["ETag"], '"1"')
+
+    def test_matching_if_match_applies_the_change(self):
+        self.add_plan()
+
+        response = self.add_custom({self.meals[0].pk: 1}, HTTP_IF_MATCH='W/"1"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], '"2"')
+
+    def test_stale_if_match_is_rejected_and_changes_nothing(self):
+        self.add_plan()
+        self.add_custom({self.meals[0].pk: 1})
+
+        response = self.add_custom({self.meals[0].pk: 5}, **self.if_match(1))
+
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.json()["version"], 2)
+        self.assertEqual(response["ETag"], '"2"')
+        self.assertEqual(self.custom_quantities(), {self.meals[0].pk: 1})
+
+    def test_stale_batch_applies_nothing(self):
+        self.add_plan()
+
+        response = self.post(
+            "cart-batch",
+            {
+                "operations": [
+                    {"op": "set_item", "food_item": self.meals[0].pk, "quantity": 2}
+                ]
+            },
+            **self.if_match(0),
+        )
+
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.custom_quantities(), {})
+        self.assertEqual(self.cart().version, 1)
+
+    def test_wildcard_and_missing_if_match_always_apply(self):
+        self.add_plan()
+        wildcard = self.post(
+            "add-plan-to-cart", {"plan_id": self.plan.pk}, HTTP_IF_MATCH="*"
+        )
+        self.add_plan()
+
+        self.assertEqual(wildcard.status_code, 200)
+        self.assertEqual(self.cart().version, 3)
+
+    @override_settings(GUEST_CART_STORE="cache")
+    def test_cached_guest_cart_checks_the_version_too(self):
+        self.add_plan()
+
+        response = self.add_custom({self.meals[0].pk: 1}, **self.if_match(0))
+
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(
+            GuestCart.load(self.client.session.session_key).state["version"], 1
+        )
+
+
+class EnsureCartConcurrencyTests(TransactionTestCase):
+    workers = 8
+    calls = 40
+
+    def hammer(self, **lookup):
+        def create():
+            try:
+                return ensure_cart(**lookup).pk
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(create) for _ in range(self.calls)]
+            return {future.result() for future in futures}
+
+    # threads need concurrent connections to the test db (MySQL, not sqlite)
+    @skipUnlessDBFeature("test_db_allows_multiple_connections")
+    def test_parallel_guest_requests_share_one_cart(self):
+        pks = self.hammer(session_key="parallel-session")
+
+        self.assertEqual(len(pks), 1)
+        self.assertEqual(Cart.objects.filter(session_key="parallel-session").count(), 1)
+
+    # threads need concurrent connections to the test db (MySQL, not sqlite)
+    @skipUnlessDBFeature("test_db_allows_multiple_connections")
+    def test_parallel_user_requests_share_one_cart(self):
+        user = get_user_model().objects.create(username="parallel", email="p@x.co")
+
+        pks = self.hammer(user=user)
+
+        self.assertEqual(len(pks), 1)
+        self.assertEqual(Cart.objects.filter(user=user).count(), 1)
+
+    def test_existing_cart_is_fetched_in_one_query(self):
+        cart = Cart.objects.create(session_key="existing")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(ensure_cart(session_key="existing").pk, cart.pk)
+
+    def test_cart_created_after_the_first_read_is_shared(self):
+        cart = Cart.objects.create(session_key="raced")
+
+        # the first read misses: another request inserts between it and ours
+        with mock.patch.object(QuerySet, "first", return_value=None):
+            self.assertEqual(ensure_cart(session_key="raced").pk, cart.pk)
+
+        self.assertEqual(Cart.objects.filter(session_key="raced").count(), 1)
+
+    def test_cart_hidden_by_the_snapshot_is_read_with_a_lock(self):
+        cart = Cart.objects.create(session_key="snapshot")
+        real_get = QuerySet.get
+        locking = []
+
+        def snapshot_get(queryset, *args, **kwargs):
+            # REPEATABLE READ: a plain read can't see the row that beat our insert
+            locking.append(queryset.query.select_for_update)
+            if not queryset.query.select_for_update:
+                raise Cart.DoesNotExist
+            return real_get(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "first", return_value=None), mock.patch.object(
+            QuerySet, "get", autospec=True, side_effect=snapshot_get
+        ):
+            self.assertEqual(ensure_cart(session_key="snapshot").pk, cart.pk)
+
+        self.assertEqual(locking, [False, True])
+
+
+def index_name(table, columns):
+    """Name of the index on exactly `columns` of `table`, from introspection."""
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    for name, info in constraints.items():
+        if info["columns"] == columns and (info["index"] or info["unique"]):
+            if name.startswith("__unnamed") and connection.vendor == "sqlite":
+                # sqlite names inline UNIQUE indexes sqlite_autoindex_<table>_<n>
+                return f"sqlite_autoindex_{table}"
+            return name
+    raise AssertionError(f"no index on {table}{columns}")
+
+
+def explain_keys(plan):
+    """Every index MySQL's EXPLAIN FORMAT=JSON reports as used ("key"), at any depth."""
+    if isinstance(plan, dict):
+        if isinstance(plan.get("key"), str):
+            yield plan["key"]
+        children = plan.values()
+    elif isinstance(plan, list):
+        children = plan
+    else:
+        return
+    for child in children:
+        yield from explain_keys(child)
+
+
+class QueryPlanTestMixin:
+    """
+    Index assertions read each backend's own plan output: sqlite's and
+    PostgreSQL's text plans name the index, MySQL's JSON plan has it in "key".
+    The test tables are near-empty, so PostgreSQL is told to avoid sequential
+    scans for the rest of the test (the TestCase transaction). Other backends
+    skip.
+    """
+
+    def assertUsesIndex(self, queryset, name):
+        vendor = connection.vendor
+        if vendor == "mysql":
+            plan = queryset.explain(format="json")
+            self.assertIn(
+                name,
+                set(explain_keys(json.loads(plan))),
+                f"expected {name} in plan:\n{plan}",
+            )
+            return
+        if vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        elif vendor != "sqlite":
+            self.skipTest(f"no EXPLAIN assertions for {vendor}")
+        plan = queryset.explain()
+        self.assertIn(name, plan, f"expected {name} in plan:\n{plan}")
+
+
+class OrderQueryPlanTests(QueryPlanTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username="plans", email="p@x.co")
+        for status in (Order.STATUS_PENDING, Order.STATUS_PAID):
+            Order.objects.create(
+                user=cls.user,
+                status=status,
+                customer_full_name="Plan",
+                customer_email="p@x.co",
+            )
+
+    def test_order_history_page_uses_user_created_index(self):
+        page = with_first_item_id(Order.objects.filter(user=self.user)).order_by(
+            "-created_at", "-id"
+        )[:21]
+
+        self.assertUsesIndex(page, "order_user_created_idx")
+
+    def test_admin_status_filter_uses_status_created_index(self):
+        orders = Order.objects.filter(
+            status=Order.STATUS_PAID, created_at__gte=timezone.now()
+        ).order_by("-created_at")
+
+        self.assertUsesIndex(orders, "order_status_created_idx")
+
+    def test_guest_lookup_uses_reference_unique_index(self):
+        # reference is unique, so (customer_email, reference) needs no index of its own
+        orders = Order.objects.filter(customer_email="p@x.co", reference="abc")
+
+        self.assertUsesIndex(orders, index_name("food_order", ["reference"]))
+
+    def test_custom_item_lookup_uses_cart_food_plan_index(self):
+        items = CartItem.objects.filter(
+            cart_id=1, food_item_id=1, cart_plan__isnull=True
+        )
+
+        self.assertUsesIndex(
+            items,
+            index_name("food_cartitem", ["cart_id", "food_item_id", "cart_plan_id"]),
+        )
+
+
+class OrderHistoryPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="history", email="h@x.co")
+        other = get_user_model().objects.create(
+            username="other", email="o@x.co", phone_number="08000000001"
+        )
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        self.orders = []
+        # two pairs share a created_at so pages must also cut on id
+        for minutes in (0, 0, 1, 2, 2):
+            order = Order.objects.create(
+                user=self.user, customer_full_name="History", customer_email="h@x.co"
+            )
+            Order.objects.filter(pk=order.pk).update(
+                created_at=now - timedelta(minutes=minutes)
+            )
+            self.orders.append(order)
+        Order.objects.create(
+            user=other, customer_full_name="Other", customer_email="o@x.co"
+        )
+
+    def test_next_cursor_walks_every_order_once_newest_first(self):
+        expected = [
+            o.reference
+            for o in Order.objects.filter(user=self.user).order_by("-created_at", "-id")
+        ]
+        url = reverse("user-past-orders") + "?page_size=2"
+        seen = []
+        pages = 0
+        while url:
+            body = self.client.get(url).json()
+            self.assertLessEqual(len(body["results"]), 2)
+            seen.extend(order["reference"] for order in body["results"])
+            url = body["next"]
+            pages += 1
+
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 3)
+
+    def test_last_page_has_no_next(self):
+        body = self.client.get(reverse("user-past-orders")).json()
+        self.assertIsNone(body["next"])
+        self.assertEqual(len(body["results"]), len(self.orders))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse("user-past-orders") + "?cursor=garbage")
+        self.assertEqual(response.status_code, 404)
+
+
+WEBHOOK_SECRET = "sk_test_webhook"
+
+
+@override_settings(PAYSTACK_SECRET_KEY=WEBHOOK_SECRET)
+class PaystackWebhookTests(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(
+            customer_full_name="Hook",
+            customer_email="hook@x.co",
+            total=Decimal("1500.00"),
+        )
+        self.url = reverse("paystack-webhook")
+
+    def event(self, event="charge.success", **data):
+        data = {
+            "id": 1001,
+            "reference": self.order.reference,
+            "status": "success",
+            "amount": 150000,
+            **data,
+        }
+        return json.dumps({"event": event, "data": data}).encode()
+
+    def deliver(self, body, signature=None):
+        if signature is None:
+            signature = hmac.new(
+                WEBHOOK_SECRET.encode(), body, hashlib.sha512
+            ).hexdigest()
+        headers = {"HTTP_X_PAYSTACK_SIGNATURE": signature} if signature else {}
+        return self.client.post(
+            self.url, body, content_type="application/json", **headers
+        )
+
+    def process(self):
+        with mock.patch(
+            "accounts.zoho_email_utils.send_order_receipt_email"
+        ) as send_receipt:
+            with self.captureOnCommitCallbacks(execute=True):
+                process_pending_events()
+        self.order.refresh_from_db()
+        return PaystackEvent.objects.get(), send_receipt
+
+    def test_missing_signature_is_rejected(self):
+        response = self.deliver(self.event(), signature="")
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(PaystackEvent.objects.exists())
+
+    def test_bad_signature_is_rejected(self):
+        body = self.event()
+        signature = hmac.new(b"not-the-secret", body, hashlib.sha512).hexdigest()
+
+        response = self.deliver(body, signature)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(PaystackEvent.objects.exists())
+
+    def test_duplicate_delivery_is_stored_once(self):
+        body = self.event()
+
+        self.assertEqual(self.deliver(body).status_code, 200)
+        self.assertEqual(self.deliver(body).status_code, 200)
+
+        self.assertEqual(PaystackEvent.objects.count(), 1)
+
+    def test_charge_success_marks_order_paid(self):
+        self.deliver(self.event())
+
+        event, send_receipt = self.process()
+
+        self.assertEqual(event.outcome, "paid")
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(self.order.status, Order.STATUS_PAID)
+        self.assertIsNotNone(PaymentTransaction.objects.get(order=self.order).paid_at)
+        send_receipt.assert_called_once()
+
+    def test_other_events_are_ignored(self):
+        self.deliver(self.event(event="transfer.success"))
+
+        event, send_receipt = self.process()
+
+        self.assertEqual(event.outcome, "ignored")
+        self.assertEqual(self.order.status, Order.STATUS_PENDING)
+        send_receipt.assert_not_called()
+
+    def test_unsuccessful_charge_is_ignored(self):
+        self.deliver(self.event(status="failed"))
+
+        event, _ = self.process()
+
+        self.assertEqual(event.outcome, "ignored")
+        self.assertEqual(self.order.status, Order.STATUS_PENDING)
+
+    def test_amount_mismatch_leaves_order_pending(self):
+        self.deliver(self.event(amount=100000))
+
+        event, send_receipt = self.process()
+
+        self.assertEqual(event.outcome, "amount_mismatch")
+        self.assertEqual(self.order.status, Order.STATUS_PENDING)
+        self.assertFalse(PaymentTransaction.objects.filter(order=self.order).exists())
+        send_receipt.assert_not_called()
+
+
+def paystack_accepts(payment, payload):
+    """Stand-in for food.payments.initialize_payment when Paystack accepts."""
+    payment.authorization_url = f"https://checkout.paystack.test/{payload['reference']}"
+    payment.save(update_fields=["authorization_url"])
+    return {"status": True, "data": {"authorization_url": payment.authorization_url}}
+
+
+class CheckoutTestMixin:
+    checkout_body = {
+        "full_name": "Check Out",
+        "email": "checkout@x.co",
+        "phone_number": "08000000000",
+        "address": "1 Test Street",
+    }
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        reset_gateways()
+        self.meals = make_food_items(3)
+        self.plan = MealPlan.objects.create(meal_count=3, days=1, density="lean")
+        self.plan.meals.set(self.meals)
+        self.fill_cart()
+
+    def fill_cart(self):
+        response = self.client.post(
+            reverse("add-plan-to-cart"), {"plan_id": self.plan.pk}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def checkout(self, body=None, **extra):
+        # run the on-commit work (deferred init, idempotency records) as a real
+        # commit would
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("cart-checkout"),
+                body or self.checkout_body,
+                format="json",
+                **extra,
+            )
+
+    def payment_status(self, reference):
+        return self.client.get(reverse("payment-status", args=[reference])).json()
+
+
+class CheckoutPaymentInitTests(CheckoutTestMixin, APITestCase):
+    def test_gateway_error_answers_with_the_order_to_retry(self):
+        with mock.patch(
+            "food.views.initialize_payment",
+            side_effect=requests.ConnectionError("down"),
+        ):
+            response = self.checkout()
+
+        self.assertEqual(response.status_code, 502)
+        reference = response.json()["reference"]
+        self.assertTrue(response.json()["status_url"].endswith(f"/{reference}/"))
+        self.assertEqual(self.payment_status(reference)["status"], "failed")
+
+        with mock.patch("food.views.schedule_payment_init") as schedule:
+            retry = self.client.post(reverse("payment-status", args=[reference]))
+        self.assertEqual(retry.status_code, 202)
+        schedule.assert_called_once()
+
+    def test_rejected_init_answers_with_the_order_to_retry(self):
+        with mock.patch(
+            "food.views.initialize_payment",
+            return_value={"status": False, "message": "Invalid key"},
+        ):
+            response = self.checkout()
+
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("status_url", response.json())
+        self.assertEqual(
+            self.payment_status(response.json()["reference"])["status"], "failed"
+        )
+
+    @override_settings(PAYSTACK_INIT_MODE="deferred")
+    def test_deferred_init_runs_after_commit(self):
+        with mock.patch("food.payments._get_executor") as executor, mock.patch(
+            "food.payments.connection"
+        ), mock.patch("food.payments.initialize_payment", side_effect=paystack_accepts):
+            executor.return_value.submit.side_effect = lambda fn, *args: fn(*args)
+            response = self.checkout()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], "pending")
+        payment = self.payment_status(response.json()["reference"])
+        self.assertEqual(payment["status"], "ready")
+        self.assertTrue(payment["authorization_url"])
+
+    @override_settings(PAYSTACK_INIT_MODE="deferred", PAYSTACK_INIT_TIMEOUT=60)
+    def test_lost_deferred_init_times_out_and_can_be_retried(self):
+        with mock.patch("food.views.schedule_payment_init"):
+            reference = self.checkout().json()["reference"]
+        self.assertEqual(self.payment_status(reference)["status"], "pending")
+        self.assertEqual(
+            self.client.post(reverse("payment-status", args=[reference])).status_code,
+            409,
+        )
+
+        PaymentTransaction.objects.update(
+            created_at=timezone.now() - timedelta(minutes=2)
+        )
+        self.assertEqual(self.payment_status(reference)["status"], "failed")
+        with mock.patch("food.views.schedule_payment_init") as schedule:
+            retry = self.client.post(reverse("payment-status", args=[reference]))
+        self.assertEqual(retry.status_code, 202)
+        schedule.assert_called_once()
+        self.assertEqual(self.payment_status(reference)["status"], "pending")
+
+
+def gateway_answers(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+@override_settings(
+    OUTBOUND_GATEWAYS={
+        "paystack": {
+            "base_url": "https://paystack.test",
+            "breaker_window": 4,
+            "breaker_min_calls": 2,
+            "breaker_open_seconds": 30,
+        }
+    }
+)
+class GatewayCircuitBreakerTests(TestCase):
+    def setUp(self):
+        reset_gateways()
+        self.addCleanup(reset_gateways)
+        self.now = 1000.0
+        clock = mock.patch(
+            "ayta.http_client.time.monotonic", side_effect=lambda: self.now
+        )
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.paystack = gateway("paystack")
+
+    def call(self, **answer):
+        with mock.patch.object(self.paystack.session, "request", **answer) as send:
+            try:
+                self.paystack.get("/ping")
+            except requests.RequestException:
+                pass
+        return send
+
+    def open_circuit(self):
+        for _ in range(2):
+            self.call(side_effect=requests.ConnectionError("down"))
+        self.assertEqual(self.paystack.breaker.state, CIRCUIT_OPEN)
+
+    def test_failures_open_the_circuit(self):
+        self.call(return_value=gateway_answers(200))
+        self.call(return_value=gateway_answers(502))
+        self.assertEqual(self.paystack.breaker.state, CIRCUIT_OPEN)
+
+        with mock.patch.object(self.paystack.session, "request") as send:
+            with self.assertRaises(CircuitOpenError) as raised:
+                self.paystack.get("/ping")
+        send.assert_not_called()
+        self.assertEqual(raised.exception.retry_after, 30)
+        stats = gateway_stats("paystack")["paystack"]
+        self.assertEqual((stats["calls"], stats["errors"]), (2, 1))
+        self.assertEqual(stats["circuit"], CIRCUIT_OPEN)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.open_circuit()
+        self.now += 30
+        self.assertEqual(self.paystack.breaker.state, CIRCUIT_HALF_OPEN)
+
+        self.paystack.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.paystack.breaker.before_call()
+
+    def test_successful_probe_closes_the_circuit(self):
+        self.open_circuit()
+        self.now += 30
+
+        send = self.call(return_value=gateway_answers(200))
+
+        send.assert_called_once()
+        self.assertEqual(self.paystack.breaker.state, CIRCUIT_CLOSED)
+
+    def test_failed_probe_reopens_the_circuit(self):
+        self.open_circuit()
+        self.now += 30
+
+        self.call(side_effect=requests.Timeout("slow"))
+
+        self.assertEqual(self.paystack.breaker.state, CIRCUIT_OPEN)
+        self.assertEqual(self.paystack.breaker.retry_after(), 30)
+
+
+class OrderSummaryTests(CheckoutTestMixin, APITestCase):
+    def place_order(self):
+        with mock.patch("food.views.initialize_payment", side_effect=paystack_accepts):
+            reference = self.checkout().json()["reference"]
+        return Order.objects.get(reference=reference)
+
+    def summary(self, order):
+        return OrderSummarySerializer(Order.objects.get(pk=order.pk)).data
+
+    def test_stored_summary_matches_legacy_orders(self):
+        order = self.place_order()
+        stored = self.summary(order)
+
+        snapshot = order.get_items_snapshot()
+        del snapshot["s"]
+        order.set_items_snapshot(snapshot)
+        order.save(update_fields=["items_snapshot"])
+        legacy = self.summary(order)
+
+        self.assertEqual(stored, legacy)
+        self.assertEqual(stored["total_meals"], "3 meals")
+        self.assertEqual(stored["plan_duration"], "1 Days")
+        self.assertIsInstance(stored["total_macros"]["calories"], int)
+
+    def test_stored_summary_ignores_later_menu_changes(self):
+        order = self.place_order()
+        before = self.summary(order)["total_macros"]
+
+        FoodItem.objects.update(calories=1)
+
+        self.assertEqual(self.summary(order)["total_macros"], before)
+
+    def test_custom_only_order_has_no_package(self):
+        Cart.objects.get().plans.all().delete()
+        self.client.post(
+            reverse("add-custom-selection"),
+            {"meal_ids": [self.meals[0].pk], "quantities": {self.meals[0].pk: 2}},
+            format="json",
+        )
+        summary = self.summary(self.place_order())
+
+        self.assertIsNone(summary["package_type"])
+        self.assertIsNone(summary["total_meals"])
+        self.assertIsNone(summary["total_macros"])
+
+
+class CheckoutQueryCountTests(CheckoutTestMixin, APITestCase):
+    # cart, savepoint, plans, items, the first plan's meals, order, order items,
+    # payment, four to clear the cart, its version bump and reload, release, and
+    # the authorization URL
+    CHECKOUT_QUERIES = 16
+
+    def assertChecksOutIn(self, num):
+        with mock.patch(
+            "food.views.initialize_payment", side_effect=paystack_accepts
+        ), self.assertNumQueries(num):
+            response = self.checkout()
+        self.assertEqual(response.status_code, 200)
+        return Order.objects.get(reference=response.json()["reference"])
+
+    def test_small_cart(self):
+        order = self.assertChecksOutIn(self.CHECKOUT_QUERIES)
+        self.assertEqual(order.items.count(), 1)
+
+    def test_large_cart_takes_the_same_queries(self):
+        plan = MealPlan.objects.create(meal_count=3, days=2, density="lean")
+        plan.meals.set(make_food_items(3))
+        self.client.post(
+            reverse("add-plan-to-cart"), {"plan_id": plan.pk}, format="json"
+        )
+        foods = make_food_items(4)
+        self.client.post(
+            reverse("add-custom-selection"),
+            {"meal_ids": [f.pk for f in foods], "quantities": {f.pk: 2 for f in foods}},
+            format="json",
+        )
+
+        order = self.assertChecksOutIn(self.CHECKOUT_QUERIES)
+        self.assertEqual(order.items.count(), 6)
+
+
+class CheckoutCircuitOpenTests(CheckoutTestMixin, APITestCase):
+    def test_open_circuit_answers_503_before_creating_the_order(self):
+        with mock.patch("food.views.paystack_retry_after", return_value=12.5):
+            response = self.checkout()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "13")
+        self.assertNotIn("reference", response.json())
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.get().plans.count(), 1)
+
+    def test_circuit_opening_mid_checkout_keeps_the_order(self):
+        with mock.patch(
+            "food.views.initialize_payment",
+            side_effect=CircuitOpenError("paystack", 30),
+        ):
+            response = self.checkout()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "30")
+        reference = response.json()["reference"]
+        self.assertEqual(self.payment_status(reference)["status"], "failed")
+
+
+class CheckoutIdempotencyTests(CheckoutTestMixin, APITestCase):
+    key = {"HTTP_IDEMPOTENCY_KEY": "checkout-1"}
+
+    def test_retry_replays_the_first_response(self):
+        with mock.patch(
+            "food.views.initialize_payment", side_effect=paystack_accepts
+        ) as init:
+            first = self.checkout(**self.key)
+            retry = self.checkout(**self.key)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        init.assert_called_once()
+
+    def test_retry_while_in_flight_is_a_conflict(self):
+        retries = []
+
+        def init_with_retry(payment, payload):
+            retries.append(self.checkout(**self.key))
+            return paystack_accepts(payment, payload)
+
+        with mock.patch("food.views.initialize_payment", side_effect=init_with_retry):
+            first = self.checkout(**self.key)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(retries[0]["Retry-After"], "1")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        with mock.patch("food.views.initialize_payment", side_effect=paystack_accepts):
+            self.checkout(**self.key)
+            other = self.checkout(
+                {**self.checkout_body, "address": "2 Elsewhere"}, **self.key
+            )
+
+        self.assertEqual(other.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retry_after_gateway_failure_replays_the_order(self):
+        with mock.patch(
+            "food.views.initialize_payment",
+            side_effect=requests.ConnectionError("down"),
+        ) as init:
+            first = self.checkout(**self.key)
+            retry = self.checkout(**self.key)
+
+        self.assertEqual(first.status_code, 502)
+        self.assertEqual(retry.status_code, 502)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json()["reference"], first.json()["reference"])
+        self.assertEqual(Order.objects.count(), 1)
+        init.assert_called_once()
+
+    def test_retry_after_crash_past_commit_replays_the_order(self):
+        with mock.patch(
+            "food.views.initialize_payment", side_effect=RuntimeError("worker died")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.checkout(**self.key)
+        order = Order.objects.get()
+
+        retry = self.checkout(**self.key)
+
+        self.assertEqual(retry.status_code, 202)
+        self.assertEqual(retry.json()["reference"], order.reference)
+        self.assertEqual(retry.json()["status"], "pending")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_validation_error_releases_the_key(self):
+        invalid = self.checkout({"full_name": "No Email"}, **self.key)
+        with mock.patch("food.views.initialize_payment", side_effect=paystack_accepts):
+            valid = self.checkout(**self.key)
+
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual(valid.status_code, 200)
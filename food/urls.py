@@ -1,14 +1,18 @@
 from django.urls import path
 from food.paystack_verify import paystack_verify_redirect
+from food.paystack_webhook import paystack_webhook
 from .views import (
     AddCustomSelectionView,
     AddPlanToCartView,
+    BatchCartView,
     FoodItemListView,
     LeanFoodItemListView,
     DenseFoodItemListView,
     FoodItemDetailView,
+    GatewayStatusView,
     CartView,
     OrderSummaryView,
+    PaymentStatusView,
     RemoveFromCartView,
     CheckoutView,
     MealPlanByTypeView,
@@ -46,11 +50,21 @@ urlpatterns = [
     ),
     path("cart/total-meals/", TotalCartMealsView.as_view(), name="total-cart-meals"),
     path("cart/remove-item/", RemoveFromCartView.as_view(), name="remove-from-cart"),
+    path("cart/batch/", BatchCartView.as_view(), name="cart-batch"),
     path("cart/checkout/", CheckoutView.as_view(), name="cart-checkout"),
     path("cart/summary/", OrderSummaryView.as_view(), name="cart-summary"),
     path("cart/merge/", MergeGuestCartView.as_view(), name="merge-guest-cart"),
     path("upload/image/", ImageUploadView.as_view(), name="upload-image"),
     path("payments/verify/", paystack_verify_redirect, name="paystack-verify"),
+    path("payments/webhook/", paystack_webhook, name="paystack-webhook"),
+    path(
+        "payments/gateways/", GatewayStatusView.as_view(), name="payment-gateways"
+    ),
+    path(
+        "payments/status/<str:reference>/",
+        PaymentStatusView.as_view(),
+        name="payment-status",
+    ),
     path("orders/past/", UserPastOrdersView.as_view(), name="user-past-orders"),
     path(
         "orders/track/", GuestOrderTrackingView.as_view(), name="guest-order-tracking"
@@ -6,15 +6,23 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from accounts.authentication import CookieJWTAuthentication
-from .order_serializers import OrderSummarySerializer, GuestOrderLookupSerializer
+from .order_serializers import (
+    OrderSummarySerializer,
+    GuestOrderLookupSerializer,
+    prefetch_first_items,
+    with_first_item_id,
+)
+from .pagination import CreatedAtKeysetPagination
 from collections import defaultdict
 from typing import Any, Dict, cast
-from django.conf import settings
-from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 from django.urls import reverse
+import math
 import requests
+from ayta.http_client import CircuitOpenError, gateway_stats
 from rest_framework.request import Request
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import generics, status, permissions
@@ -91,13 +99,10 @@ class ImageUploadView(APIView):
 
 
 from .models import (
-    CartPlan,
     FoodItem,
     Cart,
-    CartItem,
     MealPlan,
     Order,
-    OrderItem,
     PaymentTransaction,
 )
 from .serializers import (
@@ -105,7 +110,27 @@ from .serializers import (
     FoodItemListSerializer,
     FoodItemDetailSerializer,
 )
-from .cart_serializers import CartSerializer
+from .cart_serializers import CartBatchSerializer, CartDeltaSerializer, CartSerializer
+from .cart_ops import (
+    CartMutation,
+    CartItemConflict,
+    CartOperationError,
+    CartVersionConflict,
+    ensure_cart,
+)
+from .guest_carts import GuestCart, cache_store_enabled, mutation_for
+from .catalog_cache import CachedCatalogListMixin
+from .idempotency import mark_created, run_idempotent
+from .orders import create_order
+from .payments import (
+    build_init_payload,
+    init_is_deferred,
+    initialize_payment,
+    paystack_retry_after,
+    record_init_failure,
+    schedule_payment_init,
+)
+from .pricing import price_cart
 from .plan_serializers import FoodItemSerializer, MealPlanSimpleSerializer
 from decimal import Decimal
 from rest_framework.views import APIView
@@ -114,16 +139,49 @@ from rest_framework import status, permissions
 
 
 # Helper functions for guest cart management
+def get_cart(request):
+    """
+    The request's existing cart, or None. Resolved at most once per request
+    (memoized on the underlying HttpRequest) and never creates a cart or a
+    session, so read-only views stay free for visitors without a cart.
+    """
+    http_request = getattr(request, "_request", request)
+    if not hasattr(http_request, "_cart"):
+        cart = None
+        if request.user.is_authenticated:
+            cart = Cart.objects.filter(user=request.user).first()
+        elif request.session.session_key and cache_store_enabled():
+            guest_cart = GuestCart.load(request.session.session_key)
+            cart = guest_cart.as_cart() if guest_cart else None
+        elif request.session.session_key:
+            cart = Cart.objects.filter(session_key=request.session.session_key).first()
+        http_request._cart = cart
+    return http_request._cart
+
+
+def empty_cart(request):
+    """Unsaved stand-in for a visitor without a cart; serializes without queries."""
+    return Cart(user=request.user if request.user.is_authenticated else None)
+
+
 def get_or_create_cart(request):
     """Get or create cart for authenticated user or guest session"""
+    cart = get_cart(request)
+    if cart is not None:
+        return cart
     if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
+        cart = ensure_cart(user=request.user)
     else:
         # For guest users, use session key
         if not request.session.session_key:
             request.session.create()
         session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
+        if cache_store_enabled():
+            # written to the cache by the first mutation's commit()
+            cart = GuestCart(session_key).as_cart()
+        else:
+            cart = ensure_cart(session_key=session_key)
+    getattr(request, "_request", request)._cart = cart
     return cart
 
 
@@ -134,6 +192,84 @@ def get_guest_session_key(request):
     return request.session.session_key
 
 
+def wants_cart_delta(request):
+    """Mutation endpoints answer with a delta for ?response=delta or X-Cart-Response: delta."""
+    mode = request.query_params.get("response") or request.headers.get(
+        "X-Cart-Response"
+    )
+    return (mode or "").lower() == "delta"
+
+
+def cart_etag(version):
+    return f'"{version}"'
+
+
+def if_match_version(request):
+    """
+    Cart version from an If-Match header (an ETag from cart_etag), or None when
+    the client sent no precondition or "*". Only the first tag of a list is used;
+    anything unparseable can never match.
+    """
+    value = request.headers.get("If-Match", "").strip()
+    if not value or value == "*":
+        return None
+    tag = value.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        return -1
+
+
+def cart_precondition_failed(current_version):
+    """412 for a mutation whose If-Match no longer matches the cart version."""
+    response = Response(
+        {
+            "error": "Cart was changed by another request. Reload it and try again.",
+            "version": current_version,
+        },
+        status=status.HTTP_412_PRECONDITION_FAILED,
+    )
+    if current_version is not None:
+        response["ETag"] = cart_etag(current_version)
+    return response
+
+
+def payment_gateway_unavailable(retry_after, **extra):
+    """Fast 503 while Paystack's circuit is open; the client may retry later."""
+    retry_after = max(1, math.ceil(retry_after))
+    response = Response(
+        {
+            "error": "Payment gateway is temporarily unavailable. Please retry shortly.",
+            "retryable": True,
+            "retry_after": retry_after,
+            **extra,
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def cart_mutation_response(request, cart, mutation, default=None):
+    """
+    Respond to a cart mutation: the changed lines + totals + version when the client
+    opted into deltas, otherwise `default` (or the full cart). The ETag carries the
+    new version for the client's next If-Match.
+    """
+    if wants_cart_delta(request):
+        serializer = CartDeltaSerializer(cart, context={"mutation": mutation})
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+    elif default is not None:
+        response = default
+    else:
+        serializer = CartSerializer(cart)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+    response["ETag"] = cart_etag(cart.version)
+    return response
+
+
 def merge_guest_cart_to_user(user, session_key):
     """
     Merge guest cart items into user's cart when they log in.
@@ -141,58 +277,36 @@ def merge_guest_cart_to_user(user, session_key):
     """
     from django.db import transaction
 
+    if cache_store_enabled():
+        cached_cart = GuestCart.load(session_key)
+        if cached_cart is not None:
+            # cache-backed guest cart: write its lines straight into the user's cart
+            user_cart = ensure_cart(user=user)
+            return cached_cart.materialize(into=user_cart)
+
     try:
         # Get guest cart
         guest_cart = Cart.objects.get(session_key=session_key)
     except Cart.DoesNotExist:
         # No guest cart exists, just return user's cart
-        user_cart, _ = Cart.objects.get_or_create(user=user)
+        user_cart = ensure_cart(user=user)
         return user_cart
 
     # Get or create user cart
-    user_cart, _ = Cart.objects.get_or_create(user=user)
+    user_cart = ensure_cart(user=user)
 
     with transaction.atomic():
-        # Merge CartPlans (meal plans)
-        for guest_plan in guest_cart.plans.all():
-            # Check if user already has this meal plan in cart
-            existing_plan = user_cart.plans.filter(
-                meal_plan=guest_plan.meal_plan
-            ).first()
-            if existing_plan:
-                # Increase quantity
-                existing_plan.quantity += guest_plan.quantity
-                existing_plan.save()
-            else:
-                # Move the plan to user cart
-                guest_plan.cart = user_cart
-                guest_plan.save()
-
-        # Merge CartItems (individual food items)
-        for guest_item in guest_cart.items.all():
-            # Check if user already has this food item with same cart_plan
-            existing_item = user_cart.items.filter(
-                food_item=guest_item.food_item, cart_plan=guest_item.cart_plan
-            ).first()
-
-            if existing_item:
-                # Increase quantity
-                existing_item.quantity += guest_item.quantity
-                existing_item.save()
-            else:
-                # Move the item to user cart
-                guest_item.cart = user_cart
-                guest_item.save()
-
-        # Delete the now-empty guest cart
+        # set-based merge: constant number of statements however big either cart is
+        mutation = CartMutation(user_cart)
+        mutation.merge_from(guest_cart)
+        mutation.commit()
+
+        # Delete the guest cart (and any plans that were merged into existing ones)
         guest_cart.delete()
 
     return user_cart
 
 
-PAYSTACK_INIT_URL = "https://api.paystack.co/transaction/initialize"
-
-
 # --- User Past Orders Endpoint ---
 class UserPastOrdersView(APIView):
     authentication_classes = [
@@ -201,19 +315,30 @@ class UserPastOrdersView(APIView):
     ]
     permission_classes = [IsAuthenticated]
 
+    pagination_class = CreatedAtKeysetPagination
+
     def get(self, request):
-        orders = Order.objects.filter(user=request.user).order_by("-created_at")
-        serializer = OrderSummarySerializer(orders, many=True)
-        return Response(serializer.data)
+        """
+        Newest first, a page at a time: { "next": <url or null>, "results": [...] }.
+        Follow `next` (it carries the keyset cursor); `page_size` is up to 100.
+        """
+        paginator = self.pagination_class()
+        orders = paginator.paginate_queryset(
+            with_first_item_id(Order.objects.filter(user=request.user)),
+            request,
+            view=self,
+        )
+        serializer = OrderSummarySerializer(prefetch_first_items(orders), many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class TotalCartMealsView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        cart = get_or_create_cart(request)
-        total_meals = sum(item.quantity for item in cart.items.all())
-        return Response({"total_meals": total_meals})
+        cart = get_cart(request)
+        # stored on the cart row, kept up to date by CartMutation
+        return Response({"total_meals": cart.meal_count if cart else 0})
 
 
 class AdminDefinedMealsByDayView(APIView):
@@ -317,9 +442,15 @@ class MealPlanByTypeView(generics.ListAPIView):
         return MealPlan.objects.filter(meals__food_type=plan_type).distinct()
 
 
-class MealsByTypeCategoryView(generics.ListAPIView):
+class MealsByTypeCategoryView(CachedCatalogListMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = FoodItemSerializer
+    catalog_cache_name = "meals-by-type-category"
+    catalog_cache_params = ("type", "category")
+    catalog_cache_values = {
+        "type": [value for value, _ in FoodItem.FOOD_TYPE_CHOICES],
+        "category": [value for value, _ in FoodItem.CATEGORY_CHOICES],
+    }
 
     def get_queryset(self):
         food_type = self.request.GET.get("type")
@@ -356,23 +487,26 @@ class CustomMealSelectionView(APIView):
         )
 
 
-class FoodItemListView(generics.ListAPIView):
+class FoodItemListView(CachedCatalogListMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     queryset = FoodItem.objects.all()
     serializer_class = FoodItemListSerializer
+    catalog_cache_name = "meals"
 
 
-class LeanFoodItemListView(generics.ListAPIView):
+class LeanFoodItemListView(CachedCatalogListMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = FoodItemListSerializer
+    catalog_cache_name = "meals-lean"
 
     def get_queryset(self):
         return FoodItem.objects.filter(food_type="lean")
 
 
-class DenseFoodItemListView(generics.ListAPIView):
+class DenseFoodItemListView(CachedCatalogListMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = FoodItemListSerializer
+    catalog_cache_name = "meals-dense"
 
     def get_queryset(self):
         return FoodItem.objects.filter(food_type="dense")
@@ -389,9 +523,12 @@ class CartView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        cart = get_or_create_cart(request)
+        # visitors without a cart get an empty one; nothing is created on read
+        cart = get_cart(request) or empty_cart(request)
         serializer = CartSerializer(cart)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        response["ETag"] = cart_etag(cart.version)
+        return response
 
 
 class AddPlanToCartView(APIView):
@@ -423,52 +560,29 @@ class AddPlanToCartView(APIView):
         merge = bool(request.data.get("merge", False))
 
         meal_plan = get_object_or_404(MealPlan, id=plan_id)
-        if meal_plan.meals.count() == 0:
+        meals = list(meal_plan.meals.all())
+        if not meals:
             return Response(
                 {"error": "Cannot add a meal plan with no meals to cart."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
         cart = get_or_create_cart(request)
-
-        # If merging into an existing CartPlan for the same MealPlan is desired, do it.
-        if merge:
-            existing = CartPlan.objects.filter(cart=cart, meal_plan=meal_plan).first()
-        else:
-            existing = None
+        mutation = mutation_for(cart, if_match_version(request))
 
         try:
             with transaction.atomic():
-                if existing:
-                    existing.quantity += quantity
-                    existing.save()
-                    cart_plan = existing
-                else:
-                    # snapshot price from MealPlan if it exists (optional field on MealPlan)
-                    snapshot_price = getattr(meal_plan, "price", None)
-                    cart_plan = CartPlan.objects.create(
-                        cart=cart,
-                        meal_plan=meal_plan,
-                        quantity=quantity,
-                        price=snapshot_price,
-                    )
-
-                    # create CartItem entries for each meal in the plan
-                    # by default quantity per meal inside a plan = 1 (adjust if your plan logic differs)
-                    for meal in meal_plan.meals.all():
-                        # use get_or_create in case the same food_item already exists as a custom item:
-                        # uniqueness is (cart, food_item, cart_plan) so this won't clash with custom items
-                        CartItem.objects.create(
-                            cart=cart, food_item=meal, quantity=1, cart_plan=cart_plan
-                        )
+                mutation.add_plan(meal_plan, meals, quantity=quantity, merge=merge)
+                mutation.commit()
 
+        except CartVersionConflict as exc:
+            return cart_precondition_failed(exc.current_version)
         except Exception as exc:
             return Response(
                 {"error": "Failed to add plan to cart.", "detail": str(exc)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        serializer = CartSerializer(cart)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return cart_mutation_response(request, cart, mutation)
 
 
 class UpdateCustomCartItemView(APIView):
@@ -512,45 +626,31 @@ class UpdateCustomCartItemView(APIView):
 
         food_item = get_object_or_404(FoodItem, id=food_id)
         cart = get_or_create_cart(request)
+        mutation = mutation_for(cart, if_match_version(request))
+        mutation.prime_foods([food_item])
 
         try:
             with transaction.atomic():
-                # Lock any existing custom CartItem row for this (cart, food_item)
-                existing = (
-                    CartItem.objects.select_for_update()
-                    .filter(cart=cart, food_item=food_item, cart_plan__isnull=True)
-                    .first()
-                )
-
-                if existing is None:
-                    # nothing exists yet
-                    if change <= 0:
-                        # decrement when nothing exists -> nothing to do
-                        return Response(
-                            {"error": "Item not in cart."},
-                            status=status.HTTP_400_BAD_REQUEST,
-                        )
-                    # create new custom item
-                    CartItem.objects.create(
-                        cart=cart, food_item=food_item, quantity=change, cart_plan=None
+                # lock-free: the quantity is adjusted in SQL, not read-modify-write
+                if not mutation.adjust_custom_item(food_item.pk, change):
+                    # decrement when nothing exists -> nothing to do
+                    return Response(
+                        {"error": "Item not in cart."},
+                        status=status.HTTP_400_BAD_REQUEST,
                     )
-                else:
-                    # update existing
-                    new_qty = existing.quantity + change
-                    if new_qty <= 0:
-                        existing.delete()
-                    else:
-                        existing.quantity = new_qty
-                        existing.save()
+                mutation.commit()
 
+        except CartVersionConflict as exc:
+            return cart_precondition_failed(exc.current_version)
+        except CartItemConflict as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
         except Exception as exc:
             return Response(
                 {"error": "Failed to update cart item", "detail": str(exc)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        serializer = CartSerializer(cart)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return cart_mutation_response(request, cart, mutation)
 
 
 class AddCustomSelectionView(APIView):
@@ -572,48 +672,52 @@ class AddCustomSelectionView(APIView):
 
         quantities: Dict[str, Any] = request.data.get("quantities", {})
 
-        cart = get_or_create_cart(request)
-
+        # parse the selection up front; repeated ids add up like repeated clicks
+        selection: Dict[int, int] = {}
         try:
-            with transaction.atomic():
-                for mid in meal_ids:
-                    try:
-                        fid = int(mid)
-                    except (TypeError, ValueError):
-                        return Response(
-                            {"error": f"Invalid meal id: {mid}"},
-                            status=status.HTTP_400_BAD_REQUEST,
-                        )
-
-                    food_item = get_object_or_404(FoodItem, id=fid)
-                    qty = int(quantities.get(str(fid), 1))
-                    if qty <= 0:
-                        # skip zero/negative quantities (or you can choose to error out)
-                        continue
-
-                    item, created = CartItem.objects.get_or_create(
-                        cart=cart,
-                        food_item=food_item,
-                        cart_plan__isnull=True,
-                        defaults={"quantity": qty},
+            for mid in meal_ids:
+                try:
+                    fid = int(mid)
+                except (TypeError, ValueError):
+                    return Response(
+                        {"error": f"Invalid meal id: {mid}"},
+                        status=status.HTTP_400_BAD_REQUEST,
                     )
-                    if not created:
-                        item.quantity += qty
-                        item.save()
+                qty = int(quantities.get(str(fid), 1))
+                # zero/negative quantities are skipped (but the id is still validated)
+                selection[fid] = selection.get(fid, 0) + max(qty, 0)
+        except Exception as exc:
+            return Response(
+                {"error": "Failed to add custom selection.", "detail": str(exc)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
 
-        except Http404:
+        # one id__in lookup validates the whole selection
+        found = list(FoodItem.objects.filter(id__in=selection))
+        if len(found) != len(selection):
             return Response(
                 {"error": "One of the selected meals was not found."},
                 status=status.HTTP_404_NOT_FOUND,
             )
+
+        cart = get_or_create_cart(request)
+        mutation = mutation_for(cart, if_match_version(request))
+        mutation.prime_foods(found)
+
+        try:
+            with transaction.atomic():
+                mutation.add_custom_items(selection)
+                mutation.commit()
+
+        except CartVersionConflict as exc:
+            return cart_precondition_failed(exc.current_version)
         except Exception as exc:
             return Response(
                 {"error": "Failed to add custom selection.", "detail": str(exc)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        serializer = CartSerializer(cart)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return cart_mutation_response(request, cart, mutation)
 
 
 class RemoveFromCartView(APIView):
@@ -627,19 +731,32 @@ class RemoveFromCartView(APIView):
 
     def post(self, request):
         cart = get_or_create_cart(request)
+        mutation = mutation_for(cart, if_match_version(request))
 
         cart_plan_id = request.data.get("cart_plan_id")
         food_item_id = request.data.get("food_item")
 
         if cart_plan_id:
             try:
-                cp = CartPlan.objects.get(id=cart_plan_id, cart=cart)
-            except CartPlan.DoesNotExist:
+                cp_id = int(cart_plan_id)
+            except (TypeError, ValueError):
+                cp_id = None
+            try:
+                with transaction.atomic():
+                    missing = cp_id is None or mutation.remove_plans([cp_id])
+                    mutation.commit()
+            except CartVersionConflict as exc:
+                return cart_precondition_failed(exc.current_version)
+            if missing:
                 return Response(
                     {"error": "CartPlan not found."}, status=status.HTTP_404_NOT_FOUND
                 )
-            cp.delete()  # cascade will delete child CartItems
-            return Response({"message": "Plan removed"}, status=status.HTTP_200_OK)
+            return cart_mutation_response(
+                request,
+                cart,
+                mutation,
+                Response({"message": "Plan removed"}, status=status.HTTP_200_OK),
+            )
 
         if food_item_id:
             try:
@@ -651,12 +768,19 @@ class RemoveFromCartView(APIView):
                 )
 
             # only remove custom items (cart_plan is NULL)
-            ci = CartItem.objects.filter(
-                cart=cart, food_item_id=fi, cart_plan__isnull=True
-            ).first()
-            if ci:
-                ci.delete()
-                return Response({"message": "Item removed"}, status=status.HTTP_200_OK)
+            try:
+                with transaction.atomic():
+                    missing = mutation.remove_custom_items([fi])
+                    mutation.commit()
+            except CartVersionConflict as exc:
+                return cart_precondition_failed(exc.current_version)
+            if not missing:
+                return cart_mutation_response(
+                    request,
+                    cart,
+                    mutation,
+                    Response({"message": "Item removed"}, status=status.HTTP_200_OK),
+                )
             return Response(
                 {"error": "Item not found in custom items."},
                 status=status.HTTP_404_NOT_FOUND,
@@ -668,31 +792,128 @@ class RemoveFromCartView(APIView):
         )
 
 
+class BatchCartView(APIView):
+    """
+    POST /cart/batch/
+    Body: { "operations": [
+        {"op": "add_plan", "plan_id": <int>, "quantity": <int, default 1>, "merge": <bool>},
+        {"op": "set_item", "food_item": <int>, "quantity": <int, 0 removes>},
+        {"op": "remove_plan", "cart_plan_id": <int>},
+        {"op": "remove_item", "food_item": <int>}
+    ] }
+    Applies the operations in order inside one transaction and returns one cart snapshot.
+    If any operation fails nothing is applied and the error carries its "index".
+    """
+
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = cast(Dict[str, Any], serializer.validated_data)
+        operations = data["operations"]
+
+        # preload everything the operations reference with one query per table
+        plan_ids = {o["plan_id"] for o in operations if o["op"] == "add_plan"}
+        meal_plans = MealPlan.objects.in_bulk(plan_ids)
+        plan_meals = defaultdict(list)
+        for row in MealPlan.meals.through.objects.filter(
+            mealplan_id__in=plan_ids
+        ).select_related("fooditem"):
+            plan_meals[row.mealplan_id].append(row.fooditem)
+
+        food_ids = {o["food_item"] for o in operations if "food_item" in o}
+        foods = FoodItem.objects.in_bulk(food_ids)
+
+        for index, op in enumerate(operations):
+            if op["op"] == "add_plan" and op["plan_id"] not in meal_plans:
+                return Response(
+                    {"error": "Meal plan not found.", "index": index},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            if op["op"] == "add_plan" and not plan_meals[op["plan_id"]]:
+                return Response(
+                    {
+                        "error": "Cannot add a meal plan with no meals to cart.",
+                        "index": index,
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if op["op"] == "set_item" and op["food_item"] not in foods:
+                return Response(
+                    {"error": "Food item not found.", "index": index},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
+        cart = get_or_create_cart(request)
+        mutation = mutation_for(cart, if_match_version(request))
+        mutation.prime_foods(foods.values())
+
+        try:
+            with transaction.atomic():
+                mutation.apply(operations, meal_plans, plan_meals)
+                mutation.commit()
+        except CartOperationError as exc:
+            return Response(
+                {"error": exc.message, "index": exc.index}, status=exc.status_code
+            )
+        except CartVersionConflict as exc:
+            return cart_precondition_failed(exc.current_version)
+        except Exception as exc:
+            return Response(
+                {"error": "Failed to apply cart operations.", "detail": str(exc)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        return cart_mutation_response(request, cart, mutation)
+
+
 class CheckoutView(APIView):
     permission_classes = [AllowAny]  # Allow both authenticated and guest users
 
     def post(self, request):
+        # a retried request with the same Idempotency-Key gets the first response
+        return run_idempotent(request, "checkout", lambda: self._checkout(request))
+
+    def _checkout(self, request):
         # parse payload (you already have CheckoutSerializer — reuse it)
         serializer = CheckoutSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         # Type cast - validated_data is guaranteed to be dict after is_valid(raise_exception=True)
         data = cast(Dict[str, Any], serializer.validated_data)
 
-        # Get cart for authenticated user or guest
-        cart = get_or_create_cart(request)
-
-        if not cart.items.exists() and not cart.plans.exists():
-            return Response({"error": "Cart empty"}, status=status.HTTP_400_BAD_REQUEST)
+        # don't create an order Paystack can't take payment for right now
+        retry_after = paystack_retry_after()
+        if retry_after:
+            return payment_gateway_unavailable(retry_after)
 
-        # compute totals from cart (or reuse your cart.total_price)
-        subtotal = Decimal(
-            cart.total_price
-        )  # assume total_price returns Decimal or numeric
-        total = subtotal  # add tax/shipping if any
+        # Get cart for authenticated user or guest
+        cart = get_cart(request) or empty_cart(request)
+        expected_version = if_match_version(request)
+        if expected_version is not None and expected_version != cart.version:
+            # the client is about to pay for a cart it hasn't seen
+            return cart_precondition_failed(cart.version)
+        guest_cart = getattr(cart, "guest_cart", None)
 
         # create order and items inside transaction
         with transaction.atomic():
-            order = Order.objects.create(
+            if guest_cart is not None and not guest_cart.is_empty:
+                # cache-backed guest cart: it becomes real rows now that it's
+                # ordered; the cache entry is only dropped if the order commits
+                cart = guest_cart.materialize()
+
+            # price the cart once; every line below reuses this breakdown
+            breakdown = price_cart(cart)
+            if breakdown.is_empty:
+                return Response(
+                    {"error": "Cart empty"}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+            subtotal = Decimal(breakdown.total)
+            total = subtotal  # add tax/shipping if any
+
+            order = create_order(
+                breakdown,
                 user=request.user if request.user.is_authenticated else None,
                 customer_full_name=data["full_name"],
                 customer_email=data["email"],
@@ -702,121 +923,143 @@ class CheckoutView(APIView):
                 tax=Decimal("0.00"),
                 shipping=Decimal("0.00"),
                 total=total,
-                items_snapshot="[]",  # we'll fill below
             )
 
-            snapshot = []
-            # snapshot plan items
-            for cp in cart.plans.select_related("meal_plan").all():
-                mp = cp.meal_plan
-                snapshot.append(
-                    {
-                        "type": "meal_plan",
-                        "meal_plan_id": mp.pk,
-                        "title": str(mp),
-                        "quantity": cp.quantity,
-                        "unit_price": str(cp.computed_price() / (cp.quantity or 1)),
-                        "line_total": str(cp.computed_price()),
-                    }
-                )
-                OrderItem.objects.create(
-                    order=order,
-                    meal_plan=mp,
-                    name=str(mp),
-                    unit_price=cp.computed_price() / (cp.quantity or 1),
-                    quantity=cp.quantity,
-                    total_price=cp.computed_price(),
-                )
-
-            # snapshot custom items
-            for ci in cart.items.filter(cart_plan__isnull=True).select_related(
-                "food_item"
-            ):
-                fi = ci.food_item
-                line_total = fi.price * ci.quantity
-                snapshot.append(
-                    {
-                        "type": "custom_item",
-                        "food_item_id": fi.pk,
-                        "name": fi.name,
-                        "quantity": ci.quantity,
-                        "unit_price": str(fi.price),
-                        "line_total": str(line_total),
-                    }
-                )
-                OrderItem.objects.create(
-                    order=order,
-                    food_item=fi,
-                    name=fi.name,
-                    unit_price=fi.price,
-                    quantity=ci.quantity,
-                    total_price=line_total,
-                )
-
-            import json
-
-            order.items_snapshot = json.dumps(snapshot)
-            order.save()
-
             # create payment record
             p = PaymentTransaction.objects.create(order=order, gateway="paystack")
 
-            # Clear the cart after order creation
-            cart.items.all().delete()
-            cart.plans.all().delete()
+            # Clear the cart (and its stored totals) after order creation
+            mutation = CartMutation(cart)
+            mutation.clear()
+            mutation.commit()
+
+            # every response from here on names the order, so the client can
+            # follow (or retry) its payment through payments/status/<reference>/
+            created = {
+                "reference": order.reference,
+                "status_url": request.build_absolute_uri(
+                    reverse("payment-status", args=[order.reference])
+                ),
+            }
+            # a retry with the same Idempotency-Key finds this order even if the
+            # rest of this request fails
+            transaction.on_commit(
+                lambda: mark_created(
+                    request, {**created, "status": PaymentTransaction.INIT_PENDING}
+                )
+            )
 
         # init paystack transaction
-        amount_kobo = int((order.total * Decimal("100")).quantize(Decimal("1")))
         callback_url = request.build_absolute_uri(reverse("paystack-verify"))
-        paystack_payload = {
-            "email": order.customer_email,
-            "amount": amount_kobo,
-            "reference": order.reference,
-            "callback_url": callback_url,
-            "metadata": {
-                "order_id": order.pk,
-                "user_id": request.user.id if request.user.is_authenticated else None,
-                "is_guest": not request.user.is_authenticated,
-            },
-        }
-        headers = {
-            "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
-            "Content-Type": "application/json",
-        }
+        paystack_payload = build_init_payload(order, callback_url)
 
-        try:
-            resp = requests.post(
-                PAYSTACK_INIT_URL, json=paystack_payload, headers=headers, timeout=15
+        if init_is_deferred():
+            # the order exists; the authorization URL is fetched off the request thread
+            schedule_payment_init(p, paystack_payload)
+            return Response(
+                {**created, "status": PaymentTransaction.INIT_PENDING},
+                status=status.HTTP_202_ACCEPTED,
             )
-            resp.raise_for_status()
-            data = resp.json()
+
+        try:
+            data = initialize_payment(p, paystack_payload)
+        except CircuitOpenError as exc:
+            # the circuit opened after the check above; the order is kept and
+            # its payment can be retried through the status endpoint
+            record_init_failure(p, {"status": False, "message": str(exc)})
+            return payment_gateway_unavailable(exc.retry_after, **created)
         except requests.RequestException as exc:
+            # failed, so payments/status/<reference>/ can retry it
+            record_init_failure(p, {"status": False, "message": str(exc)})
             return Response(
-                {"error": "payment init failed", "detail": str(exc)},
+                {"error": "payment init failed", "detail": str(exc), **created},
                 status=status.HTTP_502_BAD_GATEWAY,
             )
 
-        if data.get("status") and data.get("data"):
-            auth_url = data["data"].get("authorization_url")
-            gateway_ref = data["data"].get("reference")
-            # update payment record
-            p.authorization_url = auth_url
-            p.gateway_reference = gateway_ref
-            p.raw_response = data
-            p.save(
-                update_fields=["authorization_url", "gateway_reference", "raw_response"]
-            )
+        if p.authorization_url:
             return Response(
-                {"authorization_url": auth_url, "reference": order.reference},
+                {"authorization_url": p.authorization_url, **created},
                 status=status.HTTP_200_OK,
             )
 
+        record_init_failure(p, data)
         return Response(
-            {"error": "Failed to initialize payment", "detail": data},
+            {"error": "Failed to initialize payment", "detail": data, **created},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
 
 
+class PaymentStatusView(APIView):
+    """
+    GET /payments/status/<reference>/
+    Progress of the Paystack initialization for an order (see PAYSTACK_INIT_MODE):
+    { "reference", "status": "pending" | "ready" | "failed", "authorization_url", "order_status" }
+    POST re-schedules a failed initialization.
+    """
+
+    permission_classes = [AllowAny]
+
+    def get(self, request, reference):
+        payment = get_object_or_404(
+            PaymentTransaction.objects.select_related("order"),
+            order__reference=reference,
+        )
+        return Response(self._payload(payment), status=status.HTTP_200_OK)
+
+    def post(self, request, reference):
+        payment = get_object_or_404(
+            PaymentTransaction.objects.select_related("order"),
+            order__reference=reference,
+        )
+        if payment.init_status != PaymentTransaction.INIT_FAILED:
+            return Response(
+                {"error": "Payment initialization has not failed."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        # only one retry request gets to reset the failed (or timed-out) attempt
+        cutoff = PaymentTransaction.init_cutoff()
+        now = timezone.now()
+        if PaymentTransaction.objects.filter(
+            Q(raw_response__isnull=False)
+            | Q(init_started_at__lt=cutoff)
+            | Q(init_started_at__isnull=True, created_at__lt=cutoff),
+            pk=payment.pk,
+            authorization_url__isnull=True,
+        ).update(raw_response=None, init_started_at=now):
+            payment.raw_response = None
+            payment.init_started_at = now
+            callback_url = request.build_absolute_uri(reverse("paystack-verify"))
+            schedule_payment_init(
+                payment, build_init_payload(payment.order, callback_url)
+            )
+        return Response(self._payload(payment), status=status.HTTP_202_ACCEPTED)
+
+    def _payload(self, payment):
+        return {
+            "reference": payment.order.reference,
+            "status": payment.init_status,
+            "authorization_url": payment.authorization_url,
+            "order_status": payment.order.status,
+        }
+
+
+class GatewayStatusView(APIView):
+    """
+    GET /payments/gateways/
+    Staff only. Per-gateway call counts, latency and circuit state
+    ("closed" | "open" | "half_open") for the worker that answers.
+    """
+
+    authentication_classes = [
+        CookieJWTAuthentication,
+        JWTAuthentication,
+    ]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(gateway_stats(), status=status.HTTP_200_OK)
+
+
 def _ordinal(n: int) -> str:
     # keeps helper if you ever reuse it elsewhere; not used for start_date now
     if 10 <= (n % 100) <= 20:
@@ -854,16 +1097,12 @@ class OrderSummaryView(APIView):
         return self._get_summary(request)
 
     def _get_summary(self, request):
-        cart = get_or_create_cart(request)
-
-        cart_plans = list(cart.plans.select_related("meal_plan").all())
-        custom_items_qs = cart.items.filter(cart_plan__isnull=True).select_related(
-            "food_item"
-        )
+        cart = get_cart(request) or empty_cart(request)
+        breakdown = price_cart(cart)
 
         # Determine package type & whether to include plan duration
-        if len(cart_plans) == 1 and custom_items_qs.count() == 0:
-            plan = cart_plans[0].meal_plan
+        if len(breakdown.plans) == 1 and not breakdown.custom_items:
+            plan = breakdown.plans[0].cart_plan.meal_plan
             package_type = (
                 plan.get_density_display()
                 if hasattr(plan, "get_density_display")
@@ -876,66 +1115,15 @@ class OrderSummaryView(APIView):
             include_plan_duration = False
             plan_duration = None
 
-        # Totals
-        total_meals = 0
-        total_calories = Decimal(0)
-        total_protein = Decimal(0)
-        total_carbs = Decimal(0)
-        total_fat = Decimal(0)
-
-        # Plans: compute counts and macros
-        for cart_plan in cart_plans:
-            mp = cart_plan.meal_plan
-            qty_multiplier = cart_plan.quantity or 1
-
-            # total meals contributed by this cart_plan
-            plan_total_meals = (mp.meal_count or 0) * (mp.days or 0) * qty_multiplier
-            total_meals += plan_total_meals
-
-            # sum macros for one cycle (all meals listed in mp.meals), then scale by days and quantity
-            meals_qs = mp.meals.all()
-            cycle_cal = sum((m.calories or 0) for m in meals_qs)
-            cycle_prot = sum(Decimal(getattr(m, "protein", 0) or 0) for m in meals_qs)
-            cycle_carbs = sum(
-                Decimal(getattr(m, "carbohydrates", 0) or 0) for m in meals_qs
-            )
-            cycle_fat = sum(Decimal(getattr(m, "fat", 0) or 0) for m in meals_qs)
-
-            total_calories += (
-                Decimal(cycle_cal) * Decimal(mp.days or 0) * Decimal(qty_multiplier)
-            )
-            total_protein += (
-                Decimal(cycle_prot) * Decimal(mp.days or 0) * Decimal(qty_multiplier)
-            )
-            total_carbs += (
-                Decimal(cycle_carbs) * Decimal(mp.days or 0) * Decimal(qty_multiplier)
-            )
-            total_fat += (
-                Decimal(cycle_fat) * Decimal(mp.days or 0) * Decimal(qty_multiplier)
-            )
-
-        # Custom items: add counts and macros
-        for item in custom_items_qs:
-            fi = item.food_item
-            qty = item.quantity or 1
-            total_meals += qty
-            total_calories += Decimal(getattr(fi, "calories", 0) or 0) * Decimal(qty)
-            total_protein += Decimal(getattr(fi, "protein", 0) or 0) * Decimal(qty)
-            total_carbs += Decimal(getattr(fi, "carbohydrates", 0) or 0) * Decimal(qty)
-            total_fat += Decimal(getattr(fi, "fat", 0) or 0) * Decimal(qty)
-
-        # Money: prefer cart.total_price property; fallback to manual compute
-        try:
-            cart_total = Decimal(cart.total_price)
-        except Exception:
-            plan_total = sum((cp.computed_price() for cp in cart_plans), Decimal(0))
-            custom_total = sum(
-                (item.food_item.price * item.quantity for item in custom_items_qs),
-                Decimal(0),
-            )
-            cart_total = plan_total + custom_total
+        # Totals: meals and macros over each plan's full duration
+        total_meals, macros = breakdown.meal_totals()
+        total_calories = macros["calories"]
+        total_protein = macros["protein"]
+        total_carbs = macros["carbohydrates"]
+        total_fat = macros["fat"]
 
-        plan_total_amt = sum((cp.computed_price() for cp in cart_plans), Decimal(0))
+        cart_total = Decimal(breakdown.total)
+        plan_total_amt = Decimal(breakdown.plan_total)
 
         # Build response
         resp = {